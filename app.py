@@ -1,28 +1,55 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import (Blueprint, Flask, render_template, request, jsonify, session, stream_with_context,
+                   current_app, has_app_context, has_request_context)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.types import JSON
-from datetime import datetime
+from datetime import datetime, timedelta
+import click
 import pytz
 import uuid
 import os
 
-from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from pydantic import Field, create_model
 from dotenv import load_dotenv
+from llm_runtime import CallPolicy, CircuitBreaker, CircuitOpen, LLMRunner, LLMUnavailable
+from cache import LRUCache
+from journal import WriteJournal, replay_orphans
+from batching import MicroBatcher
+import export as export_formats
+import archive
+from grader import HeuristicGrader, NaiveBayesGrader, TieredGrader, evaluate as evaluate_grader
+from metrics import Registry
+import atexit
+import contextlib
+import functools
+import hashlib
+import hmac
+import itertools
 import json
-import re
 import logging
+import random
+import sys
+import threading
+import time
+import unicodedata
+import weakref
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY")
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///students.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# The app is built by create_app() at the end of this file; routes, request
+# hooks and CLI commands are registered on this blueprint.
+bp = Blueprint('reflection', __name__, cli_group=None)
+db = SQLAlchemy()
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
 
 # ---------------------------------------------------------------------------
 # Database models (unchanged logic)
@@ -38,6 +65,8 @@ class Student(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime)
     json_data = db.Column(JSON, nullable=False)
+    # Bumped on every write; lets a worker check a cached copy is current.
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     responses = db.relationship('Response', backref='student', lazy=True)
 
 class Response(db.Model):
@@ -47,6 +76,9 @@ class Response(db.Model):
     question_text = db.Column(db.Text, nullable=False)
     final_unmet_criteria = db.Column(JSON, nullable=False)
     attempts = db.relationship('Attempt', backref='response', lazy=True)
+    # Unique, like the attempt index below: when two workers store the same
+    # answer at once, the second insert fails instead of duplicating it.
+    __table_args__ = (db.Index('uq_response_student_question', 'student_id', 'question_number', unique=True),)
 
 class Attempt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -57,20 +89,383 @@ class Attempt(db.Model):
     response_text = db.Column(db.Text, nullable=False)
     unmet_criteria = db.Column(JSON, nullable=False)
     classifications = db.relationship('Classification', backref='attempt', lazy=True)
+    __table_args__ = (db.Index('uq_attempt_response_number', 'response_id', 'attempt_number', unique=True),)
 
 class Classification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     attempt_id = db.Column(db.Integer, db.ForeignKey('attempt.id'), nullable=False)
     criterion = db.Column(db.String(255), nullable=False)
     is_met = db.Column(db.Boolean, nullable=False)
+    # 'llm', or 'local' for verdicts settled by the local grader
+    source = db.Column(db.String(16), nullable=False, default='llm', server_default='llm')
+    __table_args__ = (db.Index('ix_classification_attempt_criterion', 'attempt_id', 'criterion'),)
+
+# Finished conversations moved out of the four tables above by
+# `flask archive-conversations`: all their rows as one compressed document
+# (see archive.py), plus the columns the export filters on.
+
+class ArchivedConversation(db.Model):
+    __tablename__ = 'archived_conversation'
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(36), unique=True, nullable=False)
+    language = db.Column(db.String(2), nullable=False)
+    conversation_status = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+# Summary tables behind /analytics, kept up to date by the write functions
+# and recomputable with `flask rebuild-analytics`. Their size depends only on
+# the number of languages, questions and criteria.
+
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summary'
+    language = db.Column(db.String(2), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    conversations = db.Column(db.Integer, nullable=False, default=0)
+
+class QuestionSummary(db.Model):
+    __tablename__ = 'question_summary'
+    language = db.Column(db.String(2), primary_key=True)
+    question_number = db.Column(db.Integer, primary_key=True)
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    followups = db.Column(db.Integer, nullable=False, default=0)
+
+class CriterionSummary(db.Model):
+    __tablename__ = 'criterion_summary'
+    language = db.Column(db.String(2), primary_key=True)
+    question_number = db.Column(db.Integer, primary_key=True)
+    criterion = db.Column(db.String(255), primary_key=True)
+    evaluated = db.Column(db.Integer, nullable=False, default=0)
+    met = db.Column(db.Integer, nullable=False, default=0)
+
+class JournalCheckpoint(db.Model):
+    journal = db.Column(db.String(64), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False)
+
+class ClassificationCacheEntry(db.Model):
+    __tablename__ = 'classification_cache'
+    key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_version = db.Column(db.String(16), nullable=False)
+    result = db.Column(JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# ---------------------------------------------------------------------------
+# Storage profile
+#
+# Several Gunicorn workers write to one SQLite file. The "production" profile
+# switches to WAL (readers no longer block the writer), relaxes fsync to
+# synchronous=NORMAL, enlarges the page cache, makes a locked database wait
+# instead of failing at once, and retries transactions that still hit
+# "database is locked". "default" leaves SQLite's own settings alone.
+# ---------------------------------------------------------------------------
+
+STORAGE_PROFILES = {
+    "production": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "cache_size": "-20000",  # KiB, i.e. ~20 MB per connection
+            "temp_store": "MEMORY",
+            "busy_timeout": "5000",  # ms
+        },
+        "lock_retries": 5,
+    },
+    "default": {
+        "pragmas": {},
+        "lock_retries": 0,
+    },
+}
+STORAGE_PROFILE = STORAGE_PROFILES[os.getenv("STORAGE_PROFILE", "production")]
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in STORAGE_PROFILE["pragmas"].items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _is_lock_error(exc):
+    message = str(exc.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_locked(func):
+    """Retry a whole transaction when SQLite reports the database as locked.
+
+    The wrapped function must be safe to re-run from the start: everything it
+    wrote in the failed attempt has been rolled back.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = STORAGE_PROFILE["lock_retries"]
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if has_app_context():
+                    db.session.rollback()
+                if attempt == retries or not _is_lock_error(exc):
+                    raise
+                delay = 0.05 * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+    return wrapper
 
 # ---------------------------------------------------------------------------
 # LLM setup – using modern LangChain LCEL (no deprecated LLMChain)
 # ---------------------------------------------------------------------------
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-llm_classifier = ChatOpenAI(temperature=0.0, model="gpt-5.2", api_key=OPENAI_API_KEY)
-llm_followup   = ChatOpenAI(temperature=0.7, model="gpt-5.2", api_key=OPENAI_API_KEY)
+# Seconds per attempt (0 waits indefinitely). The clients use the same
+# timeout and retry nothing themselves; retries are up to the call policies
+# below. The clients are built on first use in each process, see
+# build_llm_chains.
+LLM_CLASSIFY_TIMEOUT = float(os.getenv("LLM_CLASSIFY_TIMEOUT", "30")) or None
+LLM_FOLLOWUP_TIMEOUT = float(os.getenv("LLM_FOLLOWUP_TIMEOUT", "30")) or None
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30")) or None
+llm_classifier = None
+llm_followup = None
+
+# Calls run on the request's thread or greenlet; at most LLM_MAX_IN_FLIGHT of
+# them are in flight per process.
+llm_runner = LLMRunner(max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "128")))
+
+# Every call gets a deadline, a bound on its wait for an in-flight slot and up
+# to LLM_MAX_RETRIES retries of timeouts, connection errors, rate limits and
+# server errors, with jittered exponential backoff. Classification can also be hedged: an attempt still running after
+# the LLM_HEDGE_PERCENTILE percentile of recent latencies gets a duplicate
+# call and the first answer wins. After LLM_BREAKER_FAILURES failed attempts
+# in a row the breaker opens, and for LLM_BREAKER_COOLDOWN seconds calls fail
+# fast to the all-unmet classification or a canned follow-up question.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0")) or None
+
+
+def _is_retryable_llm_error(exc):
+    # openai is only imported along with the clients; until then no call can
+    # have failed in it.
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(
+        exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+
+llm_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),
+)
+LLM_POLICIES = {
+    purpose: CallPolicy(
+        purpose,
+        timeout=LLM_FOLLOWUP_TIMEOUT if purpose == "followup" else LLM_CLASSIFY_TIMEOUT,
+        retries=LLM_MAX_RETRIES,
+        backoff=LLM_RETRY_BACKOFF,
+        retryable=_is_retryable_llm_error,
+        hedge_percentile=None if purpose == "followup" else LLM_HEDGE_PERCENTILE,
+        breaker=llm_breaker,
+        queue_timeout=LLM_QUEUE_TIMEOUT,
+    )
+    for purpose in ("classify", "classify_batch", "followup")
+}
+
+# Grade concurrent answers to the same question in one call (see "Classifier
+# batching").
+CLASSIFIER_BATCHING = os.getenv("CLASSIFIER_BATCHING", "0") == "1"
+
+# ---------------------------------------------------------------------------
+# Metrics
+#
+# Prometheus metrics of this process, served at /metrics: the time spent in
+# each stage of a turn, LLM calls with their token usage (from the usage
+# metadata the model returns) and estimated cost, database statements per
+# request, and the counters of the caches, batcher and local grader. Stages
+# nest: classify_llm is the part of grade that waited on the model. With
+# REQUEST_TRACE_LOG set, every request also appends one JSON line with its
+# own stage timings, statement count and tokens to that file.
+# ---------------------------------------------------------------------------
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+REQUEST_TRACE_LOG = os.getenv("REQUEST_TRACE_LOG")
+# USD per million tokens; cost is not counted while both are 0
+LLM_PRICES_PER_MTOK = {
+    "input": float(os.getenv("LLM_INPUT_PRICE_PER_MTOK", "0")),
+    "output": float(os.getenv("LLM_OUTPUT_PRICE_PER_MTOK", "0")),
+}
+
+metrics = Registry()
+request_seconds = metrics.histogram(
+    "reflectionapp_request_seconds", "Time to serve a request, including a streamed body.", ["route", "status"])
+stage_seconds = metrics.histogram(
+    "reflectionapp_stage_seconds", "Time spent in one stage of a request.", ["stage"])
+request_db_statements = metrics.histogram(
+    "reflectionapp_request_db_statements", "Database statements executed per request.", ["route"],
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+db_statements = metrics.counter(
+    "reflectionapp_db_statements_total", "Database statements executed, in requests or not.")
+llm_calls = metrics.counter(
+    "reflectionapp_llm_calls_total", "LLM calls by purpose and outcome.", ["purpose", "outcome"])
+llm_tokens = metrics.counter(
+    "reflectionapp_llm_tokens_total", "Tokens reported in the usage metadata of LLM replies.", ["purpose", "kind"])
+llm_cost = metrics.counter(
+    "reflectionapp_llm_cost_usd_total", "Estimated LLM cost at the configured prices per token.", ["purpose"])
+llm_fallbacks = metrics.counter(
+    "reflectionapp_llm_fallbacks_total", "Answers given without the LLM because it was unavailable.",
+    ["purpose", "reason"])
+
+_trace_logger = logging.getLogger(f"{__name__}.trace")
+if REQUEST_TRACE_LOG:
+    _trace_handler = logging.FileHandler(REQUEST_TRACE_LOG, encoding="utf-8")
+    _trace_handler.setFormatter(logging.Formatter("%(message)s"))
+    _trace_logger.addHandler(_trace_handler)
+    _trace_logger.setLevel(logging.INFO)
+    _trace_logger.propagate = False
+
+
+def _current_trace():
+    # Kept in the WSGI environ rather than g, which an app context pushed
+    # during the request would replace.
+    return request.environ.get("reflectionapp.trace") if has_request_context() else None
+
+
+def record_stage(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    trace = _current_trace()
+    if trace is not None:
+        trace["stages"][stage] = trace["stages"].get(stage, 0.0) + seconds
+
+
+def timed_stage(stage):
+    """Decorator recording the wrapped function's run time as ``stage``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_stage(stage, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    db_statements.inc()
+    trace = _current_trace()
+    if trace is not None:
+        trace["db_statements"] += 1
+
+
+class LLMUsageRecorder(BaseCallbackHandler):
+    """Callback counting the calls and tokens of one kind of LLM call.
+
+    Tokens land in the trace of the request whose thread made the call; for
+    the calls a batch leader makes for other requests they are only counted
+    in the totals.
+    """
+
+    run_inline = True
+
+    def __init__(self, purpose):
+        self.purpose = purpose
+
+    def on_llm_end(self, response, **kwargs):
+        llm_calls.inc(purpose=self.purpose, outcome="ok")
+        tokens = {"input": 0, "output": 0}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                tokens["input"] += usage.get("input_tokens", 0)
+                tokens["output"] += usage.get("output_tokens", 0)
+        cost = 0.0
+        for kind, count in tokens.items():
+            llm_tokens.inc(count, purpose=self.purpose, kind=kind)
+            cost += count * LLM_PRICES_PER_MTOK[kind] / 1e6
+        if cost:
+            llm_cost.inc(cost, purpose=self.purpose)
+        trace = _current_trace()
+        if trace is not None:
+            for kind, count in tokens.items():
+                trace["llm_tokens"][kind] += count
+
+    def on_llm_error(self, error, **kwargs):
+        llm_calls.inc(purpose=self.purpose, outcome="error")
+
+
+LLM_USAGE = {purpose: LLMUsageRecorder(purpose) for purpose in ("classify", "classify_batch", "followup")}
+
+
+@bp.before_app_request
+def _start_trace():
+    request.environ["reflectionapp.trace"] = {
+        "started": time.perf_counter(),
+        "stages": {},
+        "db_statements": 0,
+        "llm_tokens": {"input": 0, "output": 0},
+    }
+
+
+@bp.after_app_request
+def _finish_trace(response):
+    trace = _current_trace()
+    if trace is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        method = request.method
+        # Streamed bodies are still being produced here; finish once sent.
+        response.call_on_close(lambda: _record_request(trace, route, method, response.status_code))
+    return response
+
+
+def _record_request(trace, route, method, status):
+    seconds = time.perf_counter() - trace["started"]
+    request_seconds.observe(seconds, route=route, status=status)
+    request_db_statements.observe(trace["db_statements"], route=route)
+    if REQUEST_TRACE_LOG:
+        _trace_logger.info(json.dumps({
+            "time": _now().isoformat(),
+            "method": method,
+            "route": route,
+            "status": status,
+            "conversation_id": trace.get("conversation_id"),
+            "seconds": round(seconds, 6),
+            "stages": {stage: round(value, 6) for stage, value in trace["stages"].items()},
+            "db_statements": trace["db_statements"],
+            "llm_tokens": trace["llm_tokens"],
+        }))
+
+
+@metrics.gauges
+def _component_stats():
+    components = {
+        "llm_runner": {"in_flight": llm_runner.in_flight, "peak_in_flight": llm_runner.peak_in_flight},
+        "conversation_cache": conversation_cache_stats(),
+        "classification_cache": classification_cache_stats(),
+        "answer_dedup": answer_dedup_stats(),
+    }
+    if CLASSIFIER_BATCHING:
+        components["classifier_batcher"] = classifier_batcher.stats()
+    if local_grader is not None:
+        components["local_grader"] = local_grader.stats()
+    if PERSISTENCE_MODE == 'write_behind':
+        components["journal"] = {"unflushed_conversations": len(_unflushed_conversations)}
+    for component, stats in components.items():
+        for stat, value in stats.items():
+            yield (f"reflectionapp_{component}", f"Current {component.replace('_', ' ')} counters.",
+                   {"stat": stat}, value)
+    for purpose, policy in LLM_POLICIES.items():
+        for stat, value in policy.stats().items():
+            yield ("reflectionapp_llm_policy", "Attempts, timeouts, retries, hedges and failures of LLM calls.",
+                   {"purpose": purpose, "stat": stat}, value)
+    breaker = llm_breaker.stats()
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN):
+        yield ("reflectionapp_llm_circuit_state", "1 for the current state of the LLM circuit breaker.",
+               {"state": state}, int(breaker["state"] == state))
+    for stat in ("consecutive_failures", "opened", "rejected"):
+        yield ("reflectionapp_llm_circuit", "LLM circuit breaker counters.", {"stat": stat}, breaker[stat])
 
 # ---------------------------------------------------------------------------
 # Questions & criteria (unchanged)
@@ -124,164 +519,1308 @@ questions = [
 # LLM functions – refactored to LCEL (pipe operator)
 # ---------------------------------------------------------------------------
 
-def classify_response(response_text: str, criteria: list, lang: str) -> dict:
-    """Classify a student response against a list of criteria using structured output."""
-
-    # Build a dynamic Pydantic model so the LLM returns exactly the criteria keys
-    # We use with_structured_output for reliable JSON, but since criteria names are
-    # dynamic, we fall back to a prompt-based JSON approach with LCEL.
-    criteria_description = "\n".join(
-        f'- "{c}": true if the response clearly includes elements of reflection related to this criterion, false otherwise'
-        for c in criteria
+CLASSIFIER_SYSTEM_PROMPT = (
+    "You are an evaluator. Classify the following student response (probably in {lang}, "
+    "but it can be in another language) based on whether it clearly includes elements of "
+    "reflection for each criterion.\n\n"
+    "Criteria:\n{criteria_description}\n\n"
+    "Set each criterion's field to true if the response clearly includes elements of "
+    "reflection related to that criterion, false otherwise."
+)
+CRITERION_LINE = '- {}: {}'
+
+CLASSIFIER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CLASSIFIER_SYSTEM_PROMPT),
+    ("human", "{response}")
+])
+
+# Several students' responses to the same question and criteria, graded in one
+# call (see "Classifier batching" below). Each response is wrapped in a tag
+# carrying its number, and the verdicts come back as one item per number.
+CLASSIFIER_BATCH_SYSTEM_PROMPT = (
+    "You are an evaluator. Classify each of the following student responses (probably in "
+    "{lang}, but they can be in another language) based on whether it clearly includes "
+    "elements of reflection for each criterion. Every response is enclosed in "
+    "<response index=\"n\"> tags and must be judged on its own.\n\n"
+    "Criteria:\n{criteria_description}\n\n"
+    "Return exactly one item per response with its index and each criterion's field set to "
+    "true if that response clearly includes elements of reflection related to that "
+    "criterion, false otherwise."
+)
+CLASSIFIER_BATCH_ITEM = '<response index="{}">\n{}\n</response>'
+
+CLASSIFIER_BATCH_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", CLASSIFIER_BATCH_SYSTEM_PROMPT),
+    ("human", "{responses}")
+])
+
+FOLLOWUP_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You help students reflect more deeply. Based on the student's response "
+        "(probably in {lang} but possibly another language) and the unmet criteria, "
+        "formulate a kind follow-up question.\n\n"
+        "Rules:\n"
+        "- The question MUST be written in {lang} using appropriate formal pronouns.\n"
+        "- Be concise yet address ALL the unmet aspects.\n"
+        "- Rephrase criteria contextually — don't copy them verbatim.\n"
+        "- Use accessible language for non-expert students.\n"
+        "- Do NOT thank the student or add unnecessary politeness."
+    )),
+    ("human", (
+        "Student response: {response}\n\n"
+        "Unmet criteria: {criteria}"
+    ))
+])
+
+# Asked instead of a generated follow-up while the LLM is unavailable
+FALLBACK_FOLLOWUPS = {
+    "en": "Could you describe your answer in a little more detail and explain your reasoning more precisely?",
+    "de": "Könnten Sie Ihre Antwort etwas ausführlicher beschreiben und Ihre Überlegungen genauer erläutern?",
+    "es": "¿Podría describir su respuesta con un poco más de detalle y explicar su razonamiento con más precisión?",
+    "et": "Kas saaksite oma vastust veidi üksikasjalikumalt kirjeldada ja oma mõttekäiku täpsemalt selgitada?",
+}
+
+
+class ClassifierChain:
+    """Prebuilt classification chain for one question and subset of its criteria.
+
+    The output schema has one boolean field per criterion (``criterion_<n>``,
+    numbered by position in the question), so the model returns real booleans
+    through structured output instead of free-form JSON. With ``batched``,
+    ``batch_chain`` grades several responses at once and returns a list of
+    those verdicts, each with the ``index`` of its response.
+    """
+
+    def __init__(self, question_number, criteria, all_criteria, batched=False):
+        self.criteria = tuple(criteria)
+        self.fields = {f"criterion_{all_criteria.index(c) + 1}": c for c in criteria}
+        verdict_fields = {name: (bool, Field(description=c)) for name, c in self.fields.items()}
+        schema = create_model(f"Question{question_number}Verdicts", **verdict_fields)
+        criteria_description = "\n".join(CRITERION_LINE.format(name, c) for name, c in self.fields.items())
+        # Tool calling is named explicitly: ChatOpenAI defaults to json_schema
+        # (response_format), which the fake LLM of the tests and benchmarks
+        # does not serve, so they would measure a different request.
+        self.chain = (
+            CLASSIFIER_PROMPT.partial(criteria_description=criteria_description)
+            | llm_classifier.with_structured_output(schema, method="function_calling", include_raw=True)
+        ).with_config(callbacks=[LLM_USAGE["classify"]])
+        self.batch_chain = None
+        if batched:
+            item_schema = create_model(
+                f"Question{question_number}ResponseVerdicts",
+                index=(int, Field(description="index of the response")),
+                **verdict_fields,
+            )
+            batch_schema = create_model(
+                f"Question{question_number}BatchVerdicts",
+                items=(list[item_schema], Field(description="one item per response")),
+            )
+            self.batch_chain = (
+                CLASSIFIER_BATCH_PROMPT.partial(criteria_description=criteria_description)
+                | llm_classifier.with_structured_output(
+                    batch_schema, method="function_calling", include_raw=True)
+            ).with_config(callbacks=[LLM_USAGE["classify_batch"]])
+
+    def verdicts(self, parsed):
+        """Map a parsed schema instance back to {criterion: "True"/"False"}."""
+        return {c: str(bool(getattr(parsed, name))) for name, c in self.fields.items()}
+
+
+classifier_chains = {}
+followup_chain = None
+# Chat models given to build_llm_chains (None: the default ChatOpenAI client)
+# and the process the chains were built in.
+_llm_models = (None, None)
+_llm_pid = None
+_llm_lock = threading.RLock()
+
+
+def _default_chat_models():
+    # langchain_openai (and openai with it) is the slowest import by far, so
+    # it is left until the first LLM call of a process.
+    from langchain_openai import ChatOpenAI
+    return (
+        ChatOpenAI(temperature=0.0, model="gpt-5.2", api_key=OPENAI_API_KEY,
+                   timeout=LLM_CLASSIFY_TIMEOUT, max_retries=0),
+        ChatOpenAI(temperature=0.7, model="gpt-5.2", api_key=OPENAI_API_KEY,
+                   timeout=LLM_FOLLOWUP_TIMEOUT, max_retries=0),
     )
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", (
-            "You are an evaluator. Classify the following student response (probably in {lang}, "
-            "but it can be in another language) based on whether it clearly includes elements of "
-            "reflection for each criterion.\n\n"
-            "Criteria:\n{criteria_description}\n\n"
-            "Return ONLY a valid JSON object where each key is the criterion text (exactly as given) "
-            "and each value is the string \"True\" or \"False\"."
-        )),
-        ("human", "{response}")
-    ])
-
-    chain = prompt | llm_classifier | StrOutputParser()
-
-    raw_output = chain.invoke({
-        "response": response_text,
-        "criteria_description": criteria_description,
-        "lang": lang,
-    })
 
-    # Strip markdown code fences (e.g. ```json ... ```) if present
-    cleaned = raw_output.strip()
-    cleaned = re.sub(r'^```(?:json)?\s*', '', cleaned)
-    cleaned = re.sub(r'\s*```$', '', cleaned)
-    cleaned = cleaned.strip()
+def build_llm_chains(classifier=None, followup=None):
+    """Build the LLM clients, the follow-up chain and one classifier chain per
+    question and non-empty subset of its criteria (the unmet criteria are
+    always such a subset).
+
+    Runs on the first LLM call of each process, so a forked worker never
+    shares the HTTP connection pool of its parent's clients. ``classifier``
+    and ``followup`` replace the default ChatOpenAI clients (the benchmarks
+    pass fakes) and are kept when the chains are rebuilt after a fork.
+    """
+    global llm_classifier, llm_followup, followup_chain, _llm_models, _llm_pid
+    with _llm_lock:
+        defaults = (None, None)
+        if classifier is None or followup is None:
+            defaults = _default_chat_models()
+        _llm_models = (classifier, followup)
+        llm_classifier = classifier or defaults[0]
+        llm_followup = followup or defaults[1]
+        chains = {}
+        for number, question in enumerate(questions, 1):
+            all_criteria = question["criteria"]
+            for size in range(1, len(all_criteria) + 1):
+                for subset in itertools.combinations(all_criteria, size):
+                    chains[subset] = ClassifierChain(number, subset, all_criteria, CLASSIFIER_BATCHING)
+        classifier_chains.clear()
+        classifier_chains.update(chains)
+        followup_chain = (FOLLOWUP_PROMPT | llm_followup | StrOutputParser()).with_config(
+            callbacks=[LLM_USAGE["followup"]])
+        _llm_pid = os.getpid()
+
+
+def _ensure_llm_chains():
+    if _llm_pid != os.getpid():
+        with _llm_lock:
+            if _llm_pid != os.getpid():
+                build_llm_chains(*_llm_models)
+
+
+def _classifier_chain(criteria):
+    _ensure_llm_chains()
+    chain = classifier_chains.get(tuple(criteria))
+    if chain is None:
+        # Criteria that are not a subset of a current question, e.g. the
+        # unmet criteria of a conversation stored before a wording change.
+        chain = classifier_chains[tuple(criteria)] = ClassifierChain(
+            0, criteria, list(criteria), CLASSIFIER_BATCHING)
+    return chain
+
+
+def _followup_chain():
+    _ensure_llm_chains()
+    return followup_chain
+
+
+def _llm_unavailable(purpose, exc):
+    if isinstance(exc, CircuitOpen):
+        llm_fallbacks.inc(purpose=purpose, reason="circuit_open")
+    else:
+        llm_fallbacks.inc(purpose=purpose, reason="failed")
+        logger.warning("LLM %s call failed, using the fallback: %s", purpose, exc)
+
+
+@timed_stage("classify_llm")
+def _classify_with_llm(response_text: str, criteria: list, lang: str):
+    """Ask the LLM for a verdict per criterion; return (verdicts, parsed_ok)."""
+    if CLASSIFIER_BATCHING:
+        return classifier_batcher.submit((tuple(criteria), lang), response_text)
+    return _classify_one(response_text, criteria, lang)
+
 
+def _classify_one(response_text, criteria, lang):
+    classifier = _classifier_chain(criteria)
     try:
-        output_dict = json.loads(cleaned)
-    except json.JSONDecodeError:
-        logger.error("Failed to parse LLM classification output: %s", cleaned)
+        output = llm_runner.invoke(
+            classifier.chain, {"response": response_text, "lang": lang}, LLM_POLICIES["classify"])
+    except LLMUnavailable as exc:
+        _llm_unavailable("classify", exc)
+        return {c: "False" for c in criteria}, False
+
+    if output["parsed"] is None:
+        logger.error("Failed to parse LLM classification output: %s", output["parsing_error"])
         # Fallback: mark all criteria as unmet so the conversation can continue
-        output_dict = {c: "False" for c in criteria}
+        return {c: "False" for c in criteria}, False
+    return classifier.verdicts(output["parsed"]), True
 
+
+def classify_response(response_text: str, criteria: list, lang: str) -> dict:
+    """Classify a student response against a list of criteria, using the cache."""
+    if not CLASSIFICATION_CACHE_ENABLED:
+        return _classify_with_llm(response_text, criteria, lang)[0]
+
+    key = classification_cache_key(response_text, criteria, lang)
+    cached = classification_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    with db.engine.connect() as conn:
+        row = conn.execute(
+            db.select(ClassificationCacheEntry.result).where(ClassificationCacheEntry.key == key)
+        ).first()
+    if row is not None:
+        global classification_cache_db_hits
+        with _classification_cache_lock:
+            classification_cache_db_hits += 1
+        classification_cache.set(key, row.result)
+        return dict(row.result)
+
+    output_dict, parsed_ok = _classify_with_llm(response_text, criteria, lang)
+    # Fallback verdicts are not cached, so a retry asks the LLM again.
+    if parsed_ok:
+        classification_cache.set(key, output_dict)
+        _store_classification(key, output_dict)
     return output_dict
 
 
+def _store_classification(key, result):
+    """Add a verdict to the classification_cache table.
+
+    In write-behind mode it is journaled without an fsync and written by the
+    journal writer along with the turn, instead of in a transaction of its own.
+    """
+    entry = {
+        "key": key,
+        "model": _classifier_model_name(),
+        "prompt_version": CLASSIFIER_PROMPT_VERSION,
+        "result": result,
+    }
+    if PERSISTENCE_MODE == 'write_behind':
+        _journal_write({"op": "cache", **entry}, sync=False)
+        return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(ClassificationCacheEntry).values(**entry, created_at=datetime.now(pytz.utc)))
+    except IntegrityError:
+        pass  # Another worker stored the same verdict first
+    except OperationalError as exc:
+        logger.warning("Could not store classification in cache: %s", exc)
+
+
+def _write_cache_entry(conn, record, at):
+    insert = _UPSERT_DIALECTS[conn.dialect.name](ClassificationCacheEntry)
+    conn.execute(insert.values(
+        key=record["key"],
+        model=record["model"],
+        prompt_version=record["prompt_version"],
+        result=record["result"],
+        created_at=at.astimezone(pytz.utc),
+    ).on_conflict_do_nothing(index_elements=["key"]))
+
+# ---------------------------------------------------------------------------
+# Local grader
+#
+# Empty, one-word and off-topic answers need no LLM to be judged. With
+# LOCAL_GRADER set, grade_response first asks local graders (see grader.py)
+# and only sends the criteria they are unsure about to classify_response:
+#
+#   heuristic  answers too short or repetitive to reflect on meet nothing
+#   tiered     the heuristic, then a naive Bayes model trained from earlier
+#              LLM verdicts with `flask train-grader` (LOCAL_GRADER_MODEL)
+#
+# A model verdict is used only if its probability is at most
+# LOCAL_GRADER_UNMET_BELOW or at least LOCAL_GRADER_MET_ABOVE. Check those
+# thresholds against stored verdicts with `flask evaluate-grader`.
+# ---------------------------------------------------------------------------
+
+LOCAL_GRADER = os.getenv("LOCAL_GRADER", "off")
+LOCAL_GRADER_MODEL = os.getenv("LOCAL_GRADER_MODEL", os.path.join(INSTANCE_PATH, "grader.json"))
+LOCAL_GRADER_UNMET_BELOW = float(os.getenv("LOCAL_GRADER_UNMET_BELOW", "0.02"))
+LOCAL_GRADER_MET_ABOVE = float(os.getenv("LOCAL_GRADER_MET_ABOVE", "0.98"))
+LOCAL_GRADER_MIN_WORDS = int(os.getenv("LOCAL_GRADER_MIN_WORDS", "3"))
+
+
+def build_local_grader(mode=LOCAL_GRADER, model_path=LOCAL_GRADER_MODEL,
+                       unmet_below=LOCAL_GRADER_UNMET_BELOW, met_above=LOCAL_GRADER_MET_ABOVE):
+    """The TieredGrader for a LOCAL_GRADER mode, or None for "off"."""
+    if mode == 'off':
+        return None
+    if mode not in ('heuristic', 'tiered'):
+        raise ValueError(f"Unknown LOCAL_GRADER: {mode!r}")
+    tiers = [HeuristicGrader(min_words=LOCAL_GRADER_MIN_WORDS)]
+    if mode == 'tiered':
+        if os.path.exists(model_path):
+            tiers.append(NaiveBayesGrader.load(model_path))
+        else:
+            logger.warning("No grader model at %s; run `flask train-grader`", model_path)
+    return TieredGrader(tiers, unmet_below=unmet_below, met_above=met_above)
+
+
+local_grader = build_local_grader()
+
+
+@timed_stage("grade")
+def grade_response(response_text: str, criteria: list, lang: str):
+    """Classify a response, locally where possible.
+
+    Returns (classification, graded_locally): the verdict per criterion and
+    the criteria that were settled without the LLM.
+    """
+    decided = local_grader.decide(response_text, criteria, lang) if local_grader else {}
+    remaining = [c for c in criteria if c not in decided]
+    verdicts = dict(decided)
+    if remaining:
+        verdicts.update(classify_response(response_text, remaining, lang))
+    return {c: verdicts[c] for c in criteria}, [c for c in criteria if c in decided]
+
+
+def _grader_examples(holdout=0, evaluate=False):
+    """Stored LLM verdicts per attempt: (response_text, lang, {criterion: is_met}).
+
+    Attempts whose id modulo 100 is below ``holdout`` form the evaluation
+    split; ``evaluate`` selects it instead of the training split.
+    """
+    split = (Attempt.id % 100) < holdout
+    stmt = (
+        db.select(Attempt.id, Attempt.response_text, Student.language,
+                  Classification.criterion, Classification.is_met)
+        .join(Classification, Classification.attempt_id == Attempt.id)
+        .join(Response, Response.id == Attempt.response_id)
+        .join(Student, Student.id == Response.student_id)
+        .where(Classification.source == 'llm', split if evaluate else ~split)
+        .order_by(Attempt.id)
+        .execution_options(yield_per=1000)
+    )
+    current = None
+    for row in db.session.execute(stmt):
+        if current is None or current[0] != row.id:
+            if current is not None:
+                yield current[1:]
+            current = (row.id, row.response_text, row.language, {})
+        current[3][row.criterion] = row.is_met
+    if current is not None:
+        yield current[1:]
+
+# ---------------------------------------------------------------------------
+# Classifier batching
+#
+# At the start of a class many students answer the same question within
+# seconds, and each answer is classified against the same prompt and
+# criteria. With CLASSIFIER_BATCHING=1, classification requests with the same
+# criteria and language are gathered for up to CLASSIFIER_BATCH_WAIT_MS (at
+# most CLASSIFIER_BATCH_SIZE of them) and graded in one structured call.
+# Responses whose verdicts are missing from the batch reply, or all of them
+# if it cannot be parsed, are classified one by one.
+# ---------------------------------------------------------------------------
+
+def _classify_batch(key, response_texts):
+    criteria, lang = key
+    criteria = list(criteria)
+    distinct = list(dict.fromkeys(response_texts))
+    if len(distinct) == 1:
+        result = _classify_one(distinct[0], criteria, lang)
+        return [result] * len(response_texts)
+
+    classifier = _classifier_chain(criteria)
+    try:
+        output = llm_runner.invoke(classifier.batch_chain, {
+            "responses": "\n\n".join(
+                CLASSIFIER_BATCH_ITEM.format(i, text) for i, text in enumerate(distinct, 1)
+            ),
+            "lang": lang,
+        }, LLM_POLICIES["classify_batch"])
+    except LLMUnavailable as exc:
+        # No per-response retries: they would only add load to a failing provider
+        _llm_unavailable("classify_batch", exc)
+        return [({c: "False" for c in criteria}, False)] * len(response_texts)
+    results = {}
+    if output["parsed"] is None:
+        logger.warning("Failed to parse batched classification of %d responses: %s",
+                       len(distinct), output["parsing_error"])
+    else:
+        for item in output["parsed"].items:
+            if 1 <= item.index <= len(distinct):
+                results[distinct[item.index - 1]] = (classifier.verdicts(item), True)
+
+    missing = [text for text in distinct if text not in results]
+    if missing and output["parsed"] is not None:
+        logger.warning("Batched classification left out %d of %d responses", len(missing), len(distinct))
+    for text in missing:
+        results[text] = _classify_one(text, criteria, lang)
+    return [results[text] for text in response_texts]
+
+
+classifier_batcher = MicroBatcher(
+    _classify_batch,
+    max_batch=int(os.getenv("CLASSIFIER_BATCH_SIZE", "16")),
+    max_wait=float(os.getenv("CLASSIFIER_BATCH_WAIT_MS", "50")) / 1000,
+)
+
+# ---------------------------------------------------------------------------
+# Classification cache
+#
+# Classification runs at temperature 0, so the same response, criteria set and
+# language always get the same verdict. Verdicts are cached in an in-process
+# LRU (bounded, with TTL) backed by the classification_cache table. Keys hash
+# the normalized inputs together with the model name and a fingerprint of the
+# prompt, so changing either simply stops old entries from matching;
+# `flask clear-classification-cache` removes them. Table entries older than
+# CLASSIFICATION_CACHE_DB_DAYS are pruned by `flask archive-conversations`.
+# ---------------------------------------------------------------------------
+
+CLASSIFICATION_CACHE_ENABLED = os.getenv("CLASSIFICATION_CACHE", "1") == "1"
+CLASSIFIER_PROMPT_VERSION = hashlib.sha256((
+    CLASSIFIER_SYSTEM_PROMPT + CRITERION_LINE
+    + (CLASSIFIER_BATCH_SYSTEM_PROMPT + CLASSIFIER_BATCH_ITEM if CLASSIFIER_BATCHING else "")
+).encode("utf-8")).hexdigest()[:16]
+
+classification_cache = LRUCache(
+    maxsize=int(os.getenv("CLASSIFICATION_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("CLASSIFICATION_CACHE_TTL", "3600")),
+)
+CLASSIFICATION_CACHE_DB_DAYS = int(os.getenv("CLASSIFICATION_CACHE_DB_DAYS", "30"))
+CLASSIFICATION_CACHE_PRUNE_BATCH = 1000
+classification_cache_db_hits = 0
+_classification_cache_lock = threading.Lock()
+
+
+def _classifier_model_name():
+    _ensure_llm_chains()
+    return getattr(llm_classifier, "model_name", None) or type(llm_classifier).__name__
+
+
+def _normalize_response_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def classification_cache_key(response_text, criteria, lang):
+    """Content hash identifying one classification request."""
+    material = json.dumps([
+        CLASSIFIER_PROMPT_VERSION,
+        _classifier_model_name(),
+        lang,
+        sorted(criteria),
+        _normalize_response_text(response_text),
+    ], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def classification_cache_stats():
+    """Hit/miss counters of both cache tiers."""
+    memory = classification_cache.stats()
+    db_hits = classification_cache_db_hits
+    return {
+        "memory_hits": memory["hits"],
+        "db_hits": db_hits,
+        "misses": memory["misses"] - db_hits,
+        "memory_size": memory["size"],
+        "memory_evictions": memory["evictions"],
+    }
+
+
+def invalidate_classification_cache(stale_only=False, older_than_days=None,
+                                    batch_size=CLASSIFICATION_CACHE_PRUNE_BATCH):
+    """Drop cached verdicts and return how many table entries were removed.
+
+    With stale_only, keep those of the current prompt and model. With
+    older_than_days, only drop table entries created longer ago than that;
+    the in-memory tier is kept, its entries expire within the TTL anyway.
+    Entries are deleted batch_size per transaction.
+    """
+    conditions = []
+    if stale_only:
+        conditions.append(db.or_(
+            ClassificationCacheEntry.prompt_version != CLASSIFIER_PROMPT_VERSION,
+            ClassificationCacheEntry.model != _classifier_model_name(),
+        ))
+    if older_than_days is None:
+        classification_cache.clear()
+    else:
+        cutoff = datetime.now(pytz.utc) - timedelta(days=older_than_days)
+        conditions.append(ClassificationCacheEntry.created_at < cutoff)
+    keys = db.select(ClassificationCacheEntry.key).where(*conditions).limit(batch_size)
+    stmt = db.delete(ClassificationCacheEntry).where(ClassificationCacheEntry.key.in_(keys))
+    removed = 0
+    while True:
+        with db.engine.begin() as conn:
+            deleted = conn.execute(stmt).rowcount
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+@timed_stage("followup")
 def generate_followup(response_text: str, unmet_criteria: list, lang: str) -> str:
     """Generate a follow-up question targeting unmet criteria."""
-    criteria_str = ", ".join(unmet_criteria)
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", (
-            "You help students reflect more deeply. Based on the student's response "
-            "(probably in {lang} but possibly another language) and the unmet criteria, "
-            "formulate a kind follow-up question.\n\n"
-            "Rules:\n"
-            "- The question MUST be written in {lang} using appropriate formal pronouns.\n"
-            "- Be concise yet address ALL the unmet aspects.\n"
-            "- Rephrase criteria contextually — don't copy them verbatim.\n"
-            "- Use accessible language for non-expert students.\n"
-            "- Do NOT thank the student or add unnecessary politeness."
-        )),
-        ("human", (
-            "Student response: {response}\n\n"
-            "Unmet criteria: {criteria}"
-        ))
-    ])
+    try:
+        followup = llm_runner.invoke(_followup_chain(), {
+            "response": response_text,
+            "criteria": ", ".join(unmet_criteria),
+            "lang": lang,
+        }, LLM_POLICIES["followup"])
+    except LLMUnavailable as exc:
+        _llm_unavailable("followup", exc)
+        return FALLBACK_FOLLOWUPS.get(lang, FALLBACK_FOLLOWUPS["en"])
+    return followup.strip()
 
-    chain = prompt | llm_followup | StrOutputParser()
 
-    followup = chain.invoke({
-        "response": response_text,
-        "criteria": criteria_str,
-        "lang": lang,
-    })
-    return followup.strip()
+def stream_followup(response_text: str, unmet_criteria: list, lang: str):
+    """Like generate_followup, but yield the question text chunk by chunk."""
+    started = time.perf_counter()
+    try:
+        yield from llm_runner.stream(_followup_chain(), {
+            "response": response_text,
+            "criteria": ", ".join(unmet_criteria),
+            "lang": lang,
+        }, LLM_POLICIES["followup"])
+    except LLMUnavailable as exc:
+        # Raised before the first chunk, so nothing has been sent yet
+        _llm_unavailable("followup", exc)
+        yield FALLBACK_FOLLOWUPS.get(lang, FALLBACK_FOLLOWUPS["en"])
+    finally:
+        record_stage("followup", time.perf_counter() - started)
 
 # ---------------------------------------------------------------------------
 # Data helpers (unchanged logic)
 # ---------------------------------------------------------------------------
 
+@timed_stage("load_conversation")
 def get_student_data(conversation_id):
-    student = Student.query.filter_by(conversation_id=conversation_id).first()
-    if student:
-        return student.json_data
-    return None
-
-def save_student_data(student_data):
-    with app.app_context():
-        student = Student.query.filter_by(conversation_id=student_data['conversation_id']).first()
-        if not student:
-            cet = pytz.timezone('Europe/Berlin')
-            student = Student(
+    if PERSISTENCE_MODE == 'write_behind':
+        # Turns acknowledged but not yet written by the journal writer
+        unflushed = _unflushed_conversations.get(conversation_id)
+        if unflushed is not None:
+            return json.loads(unflushed[1])
+
+    cached = conversation_cache.get(conversation_id) if CONVERSATION_CACHE_ENABLED else None
+    if cached is not None:
+        version = db.session.execute(
+            db.select(Student.version).filter_by(conversation_id=conversation_id)
+        ).scalar()
+        if version == cached[0]:
+            db.session.close()
+            return _copy_student_data(cached[1])
+        _count_stale_conversation()
+
+    row = db.session.execute(
+        db.select(Student.version, Student.conversation_status, Student.json_data)
+        .filter_by(conversation_id=conversation_id)
+    ).first()
+    archived = None
+    if row is None:
+        archived = db.session.execute(
+            db.select(ArchivedConversation.data).filter_by(conversation_id=conversation_id)
+        ).scalar()
+    # Hand the connection back to the pool now: /answer goes on to wait on the
+    # LLM, and with threaded workers holding it would exhaust the pool.
+    db.session.close()
+    if row is None:
+        return archive.unpack(archived)["json_data"] if archived is not None else None
+    _cache_conversation(conversation_id, row.version, row.conversation_status, row.json_data)
+    return _copy_student_data(row.json_data) if CONVERSATION_CACHE_ENABLED else row.json_data
+
+def _is_met(value):
+    return (value.lower() == 'true') if isinstance(value, str) else bool(value)
+
+def _now():
+    return datetime.now(pytz.timezone('Europe/Berlin'))
+
+@timed_stage("save")
+def save_student_data(student_data, new_attempt=None):
+    """Persist the conversation.
+
+    The Student row (status and json_data) is always written. ``new_attempt``
+    is the attempt just appended to the last response; only that attempt and
+    its classifications are inserted (plus the Response row on a question's
+    first attempt), so the number of statements does not grow with the
+    length of the conversation.
+
+    In write-behind mode the update is journaled and written later by the
+    journal writer; otherwise it is committed before returning.
+    """
+    if PERSISTENCE_MODE == 'write_behind':
+        _journal_write({
+            "op": "save",
+            "student_data": student_data,
+            "new_attempt": new_attempt,
+        }, student_data=student_data)
+        return
+
+    student_id, version = _commit_now(_write_conversation, student_data, new_attempt, _now())
+    _cache_conversation(
+        student_data['conversation_id'], version,
+        student_data.get('conversation_status', 'pending'), _copy_student_data(student_data),
+    )
+    logger.debug("Saved conversation %s (student %s, version %s)",
+                 student_data['conversation_id'], student_id, version)
+
+@retry_on_locked
+def _commit_now(write, *args):
+    """Run one write function in its own transaction and return its result."""
+    with db.engine.begin() as conn:
+        return write(conn, *args)
+
+@retry_on_locked
+def _commit_durably(write, *args):
+    """Like _commit_now, but the commit is on disk when this returns.
+
+    On SQLite the transaction runs with synchronous=FULL, so even under the
+    production profile's NORMAL a power loss cannot take back the commit.
+    The journal writer uses this, since it discards records once committed.
+    """
+    with db.engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            with conn.begin():
+                return write(conn, *args)
+        # The level cannot be changed inside a transaction
+        previous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        conn.exec_driver_sql("PRAGMA synchronous=FULL")
+        conn.commit()
+        try:
+            with conn.begin():
+                return write(conn, *args)
+        finally:
+            conn.exec_driver_sql(f"PRAGMA synchronous={previous}")
+            conn.commit()
+
+def _write_conversation(conn, student_data, new_attempt, now):
+    """Write the Student row and new_attempt; return (student id, new version)."""
+    status = student_data.get('conversation_status', 'pending')
+    values = {"json_data": student_data, "conversation_status": status, "version": Student.version + 1}
+    if status == 'completed':
+        values["end_time"] = now
+    # Answering an interrupted conversation makes it pending again
+    _count_status_change(conn, student_data['conversation_id'], status)
+
+    row = conn.execute(
+        db.update(Student)
+        .where(Student.conversation_id == student_data['conversation_id'])
+        .values(**values)
+        .returning(Student.id, Student.version)
+    ).first()
+    if row is None and _restore_archived(conn, student_data['conversation_id']):
+        # Written to again after it was archived; back in the hot tables now
+        return _write_conversation(conn, student_data, new_attempt, now)
+    if row is None:
+        row = conn.execute(
+            db.insert(Student).values(
                 conversation_id=student_data['conversation_id'],
                 name=student_data['name'],
                 email=student_data['email'],
                 language=student_data['language'],
                 conversation_status='pending',
                 json_data=student_data,
-                start_time=datetime.now(cet)
-            )
-            db.session.add(student)
-        else:
-            student.json_data = student_data
-            student.conversation_status = student_data.get('conversation_status', 'pending')
-
-        if student.conversation_status == 'completed':
-            cet = pytz.timezone('Europe/Berlin')
-            student.end_time = datetime.now(cet)
-
-        # Save responses
-        for i, response_data in enumerate(student_data['responses']):
-            response = Response.query.filter_by(student_id=student.id, question_number=i+1).first()
-            if not response:
-                response = Response(
-                    student_id=student.id,
-                    question_number=i+1,
-                    question_text=response_data['question_text'],
-                    final_unmet_criteria=response_data.get('unmet_criteria', [])
-                )
-                db.session.add(response)
+                start_time=now,
+                version=1,
+            ).returning(Student.id, Student.version)
+        ).first()
+        _count_conversations(conn, student_data['language'], 'pending', 1)
+
+    if new_attempt is not None:
+        _insert_attempt(conn, row.id, student_data, new_attempt)
+    return row.id, row.version
+
+def _write_session_end(conn, conversation_id, is_temporary, now):
+    values = {"end_time": now}
+    if not is_temporary:
+        # The browser's periodic save only moves end_time, which the cached
+        # copy does not hold, so only a real end invalidates it.
+        conversation_cache.pop(conversation_id)
+        values["conversation_status"] = 'interrupted'
+        values["version"] = Student.version + 1
+        _count_status_change(conn, conversation_id, 'interrupted')
+    conn.execute(
+        db.update(Student)
+        .where(Student.conversation_id == conversation_id, Student.conversation_status != 'completed')
+        .values(**values)
+    )
+
+def _write_session_resume(conn, conversation_id):
+    """Reopen an unfinished conversation; return its json_data, or None."""
+    conversation_cache.pop(conversation_id)
+    _count_status_change(conn, conversation_id, 'pending')
+    json_data = conn.execute(
+        db.update(Student)
+        .where(Student.conversation_id == conversation_id, Student.conversation_status != 'completed')
+        .values(end_time=None, conversation_status='pending', version=Student.version + 1)
+        .returning(Student.json_data)
+    ).scalar()
+    if json_data is None and _restore_archived(conn, conversation_id):
+        return _write_session_resume(conn, conversation_id)
+    return json_data
+
+def _insert_attempt(conn, student_id, student_data, attempt_data):
+    """Insert one attempt of the last response with bulk-inserted classifications."""
+    question_number = len(student_data['responses'])
+    response_data = student_data['responses'][-1]
+    attempt_number = attempt_data['attempt_number']
+    final_unmet_criteria = response_data.get('unmet_criteria', [])
+
+    response_id = None
+    if attempt_number > 1:
+        response_id = conn.execute(
+            db.update(Response)
+            .where(Response.student_id == student_id, Response.question_number == question_number)
+            .values(final_unmet_criteria=final_unmet_criteria)
+            .returning(Response.id)
+        ).scalar()
+    if response_id is None:
+        response_id = conn.execute(
+            db.insert(Response).values(
+                student_id=student_id,
+                question_number=question_number,
+                question_text=response_data['question_text'],
+                final_unmet_criteria=final_unmet_criteria,
+            ).returning(Response.id)
+        ).scalar_one()
+
+    if attempt_number == 1:
+        question_text = response_data['question_text']
+    else:
+        question_text = response_data['attempts'][attempt_number - 2].get('next_followup_question', '')
+    attempt_id = conn.execute(
+        db.insert(Attempt).values(
+            response_id=response_id,
+            attempt_number=attempt_number,
+            response_type=attempt_data['response_type'],
+            question_text=question_text,
+            response_text=attempt_data['response'],
+            unmet_criteria=attempt_data.get('unmet_criteria', []),
+        ).returning(Attempt.id)
+    ).scalar_one()
+
+    graded_locally = attempt_data.get('graded_locally', ())
+    classifications = [
+        {
+            "attempt_id": attempt_id,
+            "criterion": criterion,
+            "is_met": _is_met(is_met),
+            "source": 'local' if criterion in graded_locally else 'llm',
+        }
+        for criterion, is_met in attempt_data['classification'].items()
+    ]
+    if classifications:
+        conn.execute(db.insert(Classification), classifications)
+    _count_attempt(conn, student_data['language'], question_number, attempt_data)
+
+# ---------------------------------------------------------------------------
+# Analytics
+#
+# Per language: conversations by status. Per language and question: answered
+# questions, attempts and follow-ups. Per language, question and criterion:
+# how often the criterion was evaluated (it is only evaluated while unmet)
+# and how often it was met. The write functions above add to these counters
+# in the transaction that writes the rows they count, so /analytics reads a
+# few hundred rows at most however long the history is. Counters are only
+# ever incremented with upserts, so concurrent writers cannot lose updates.
+# ---------------------------------------------------------------------------
+
+_UPSERT_DIALECTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+
+def _add_counts(conn, model, rows, counters):
+    """Add each row's counter values to its summary row, creating it if missing."""
+    insert = _UPSERT_DIALECTS[conn.dialect.name](model)
+    keys = [c.name for c in model.__table__.primary_key.columns]
+    stmt = insert.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(insert.excluded, name) for name in counters},
+    )
+    conn.execute(stmt, rows)
+
+
+def _count_conversations(conn, language, status, delta):
+    _add_counts(conn, ConversationSummary,
+                [{"language": language, "status": status, "conversations": delta}], ["conversations"])
+
+
+def _count_status_change(conn, conversation_id, status):
+    """Move a conversation between status counters, as the status writes do.
+
+    Called before the status is written; completed conversations never change.
+    """
+    row = conn.execute(
+        db.select(Student.language, Student.conversation_status)
+        .where(Student.conversation_id == conversation_id)
+    ).first()
+    if row is None or row.conversation_status in (status, 'completed'):
+        return
+    _count_conversations(conn, row.language, row.conversation_status, -1)
+    _count_conversations(conn, row.language, status, 1)
+
+
+def _count_attempt(conn, language, question_number, attempt_data):
+    attempt_number = attempt_data['attempt_number']
+    _add_counts(conn, QuestionSummary, [{
+        "language": language,
+        "question_number": question_number,
+        "responses": int(attempt_number == 1),
+        "attempts": 1,
+        "followups": int(attempt_number > 1),
+    }], ["responses", "attempts", "followups"])
+    verdicts = [
+        {
+            "language": language,
+            "question_number": question_number,
+            "criterion": criterion,
+            "evaluated": 1,
+            "met": int(_is_met(is_met)),
+        }
+        for criterion, is_met in attempt_data['classification'].items()
+    ]
+    if verdicts:
+        _add_counts(conn, CriterionSummary, verdicts, ["evaluated", "met"])
+
+
+def rebuild_analytics():
+    """Recompute the summary tables from the raw rows, in one transaction."""
+    conversations = db.select(
+        Student.language, Student.conversation_status, db.func.count()
+    ).group_by(Student.language, Student.conversation_status)
+    questions = (
+        db.select(
+            Student.language, Response.question_number,
+            db.func.sum(db.case((Attempt.attempt_number == 1, 1), else_=0)),
+            db.func.count(),
+            db.func.sum(db.case((Attempt.attempt_number > 1, 1), else_=0)),
+        )
+        .join(Response, Response.id == Attempt.response_id)
+        .join(Student, Student.id == Response.student_id)
+        .group_by(Student.language, Response.question_number)
+    )
+    criteria = (
+        db.select(
+            Student.language, Response.question_number, Classification.criterion,
+            db.func.count(),
+            db.func.sum(db.case((Classification.is_met, 1), else_=0)),
+        )
+        .join(Attempt, Attempt.id == Classification.attempt_id)
+        .join(Response, Response.id == Attempt.response_id)
+        .join(Student, Student.id == Response.student_id)
+        .group_by(Student.language, Response.question_number, Classification.criterion)
+    )
+    with db.engine.begin() as conn:
+        for model, select, columns in (
+            (ConversationSummary, conversations, ["language", "status", "conversations"]),
+            (QuestionSummary, questions, ["language", "question_number", "responses", "attempts", "followups"]),
+            (CriterionSummary, criteria, ["language", "question_number", "criterion", "evaluated", "met"]),
+        ):
+            conn.execute(db.delete(model))
+            conn.execute(db.insert(model).from_select(columns, select))
+        _count_archived(conn)
+
+
+def _count_archived(conn):
+    """Add the archived conversations to the summary tables."""
+    conversations = {}
+    questions = {}
+    criteria = {}
+    for data in conn.execute(db.select(ArchivedConversation.data)).scalars():
+        doc = archive.unpack(data)
+        language = doc["language"]
+        counts = conversations.setdefault((language, doc["conversation_status"]), {"conversations": 0})
+        counts["conversations"] += 1
+        for response in doc["responses"]:
+            number = response["question_number"]
+            for attempt in response["attempts"]:
+                counts = questions.setdefault((language, number), {"responses": 0, "attempts": 0, "followups": 0})
+                counts["responses"] += attempt["attempt_number"] == 1
+                counts["attempts"] += 1
+                counts["followups"] += attempt["attempt_number"] > 1
+                for criterion, is_met, _ in attempt["classifications"]:
+                    counts = criteria.setdefault((language, number, criterion), {"evaluated": 0, "met": 0})
+                    counts["evaluated"] += 1
+                    counts["met"] += bool(is_met)
+    for model, totals in ((ConversationSummary, conversations), (QuestionSummary, questions),
+                          (CriterionSummary, criteria)):
+        if totals:
+            keys = [c.name for c in model.__table__.primary_key.columns]
+            rows = [dict(zip(keys, key), **counts) for key, counts in totals.items()]
+            _add_counts(conn, model, rows, [name for name in rows[0] if name not in keys])
+
+
+def analytics_summary(language=None):
+    """Conversation, question and criterion statistics per language."""
+    def rows(model):
+        stmt = db.select(model)
+        if language:
+            stmt = stmt.where(model.language == language)
+        return db.session.execute(stmt).scalars()
+
+    summary = {}
+
+    def for_language(lang):
+        return summary.setdefault(lang, {"conversations": {}, "questions": {}})
+
+    for row in rows(ConversationSummary):
+        if row.conversations:
+            for_language(row.language)["conversations"][row.status] = row.conversations
+    for row in rows(QuestionSummary):
+        for_language(row.language)["questions"][row.question_number] = {
+            "responses": row.responses,
+            "attempts": row.attempts,
+            "followups": row.followups,
+            "avg_attempts": row.attempts / row.responses if row.responses else 0.0,
+            "criteria": {},
+        }
+    for row in rows(CriterionSummary):
+        question = for_language(row.language)["questions"].setdefault(row.question_number, {"criteria": {}})
+        question["criteria"][row.criterion] = {
+            "evaluated": row.evaluated,
+            "met": row.met,
+            "met_rate": row.met / row.evaluated if row.evaluated else 0.0,
+        }
+    db.session.close()
+
+    for stats in summary.values():
+        counts = stats["conversations"]
+        total = sum(counts.values())
+        stats["total_conversations"] = total
+        stats["completion_rate"] = counts.get('completed', 0) / total if total else 0.0
+        stats["interruption_rate"] = counts.get('interrupted', 0) / total if total else 0.0
+    return summary
+
+# ---------------------------------------------------------------------------
+# Archive
+#
+# Completed and interrupted conversations that ended more than
+# ARCHIVE_AFTER_DAYS ago can be moved out of the student, response, attempt
+# and classification tables with `flask archive-conversations`, so those
+# tables and their indexes only hold recent conversations. Each one becomes a
+# single zstd-compressed row of archived_conversation. get_student_data (and
+# with it /download-chat), the export and rebuild_analytics read archived
+# conversations too; resuming or writing to an archived interrupted
+# conversation moves it back first.
+# ---------------------------------------------------------------------------
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH = 200
+
+
+def archive_conversations(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH):
+    """Archive finished conversations that ended more than ``older_than_days`` ago.
+
+    Works in transactions of ``batch_size`` conversations. Returns the
+    number of conversations, of rows removed from the hot tables and of
+    compressed bytes written.
+    """
+    cutoff = _now() - timedelta(days=older_than_days)
+    totals = {"conversations": 0, "rows": 0, "bytes": 0}
+    while True:
+        batch = _commit_now(_archive_batch, cutoff, batch_size)
+        for name, value in batch.items():
+            totals[name] += value
+        if batch["conversations"] < batch_size:
+            return totals
+
+
+def _archive_batch(conn, cutoff, limit):
+    students = conn.execute(
+        db.select(Student.id, *(getattr(Student, name) for name in archive.STUDENT_FIELDS))
+        .where(Student.conversation_status.in_(('completed', 'interrupted')), Student.end_time < cutoff)
+        .order_by(Student.id)
+        .limit(limit)
+        .with_for_update()
+    ).all()
+    if not students:
+        return {"conversations": 0, "rows": 0, "bytes": 0}
+    student_ids = [student.id for student in students]
+    rows = {student_id: [] for student_id in student_ids}
+    for row in conn.execute(_conversation_rows(student_ids)):
+        rows[row.student_id].append(row)
+
+    archived_at = _now()
+    archived = []
+    for student in students:
+        archived.append({
+            "conversation_id": student.conversation_id,
+            "language": student.language,
+            "conversation_status": student.conversation_status,
+            "start_time": student.start_time,
+            "end_time": student.end_time,
+            "archived_at": archived_at,
+            "data": archive.pack(archive.document(student, rows[student.id])),
+        })
+        conversation_cache.pop(student.conversation_id)
+    conn.execute(db.insert(ArchivedConversation), archived)
+
+    responses = db.select(Response.id).where(Response.student_id.in_(student_ids))
+    attempts = db.select(Attempt.id).where(Attempt.response_id.in_(responses))
+    removed = 0
+    for stmt in (
+        db.delete(Classification).where(Classification.attempt_id.in_(attempts)),
+        db.delete(Attempt).where(Attempt.response_id.in_(responses)),
+        db.delete(Response).where(Response.student_id.in_(student_ids)),
+        db.delete(Student).where(Student.id.in_(student_ids)),
+    ):
+        removed += conn.execute(stmt).rowcount
+    return {"conversations": len(students), "rows": removed, "bytes": sum(len(a["data"]) for a in archived)}
+
+
+def _conversation_rows(student_ids):
+    """Response, attempt and classification rows of some students, in the order archive.document expects."""
+    return (
+        db.select(
+            Response.student_id, Response.id.label("response_id"), Response.question_number,
+            Response.question_text, Response.final_unmet_criteria,
+            Attempt.id.label("attempt_id"), Attempt.attempt_number, Attempt.response_type,
+            Attempt.question_text.label("attempt_question_text"), Attempt.response_text,
+            Attempt.unmet_criteria, Classification.criterion, Classification.is_met, Classification.source,
+        )
+        .outerjoin(Attempt, Attempt.response_id == Response.id)
+        .outerjoin(Classification, Classification.attempt_id == Attempt.id)
+        .where(Response.student_id.in_(student_ids))
+        .order_by(Response.student_id, Response.question_number, Response.id,
+                  Attempt.attempt_number, Attempt.id, Classification.id)
+    )
+
+
+def _restore_archived(conn, conversation_id):
+    """Move an archived interrupted conversation back to the hot tables.
+
+    Returns False if there is no such conversation. Completed ones stay
+    archived: they are never written to again.
+    """
+    data = conn.execute(
+        db.select(ArchivedConversation.data).where(
+            ArchivedConversation.conversation_id == conversation_id,
+            ArchivedConversation.conversation_status != 'completed',
+        )
+    ).scalar()
+    if data is None:
+        return False
+    doc = archive.unpack(data)
+    student_id = conn.execute(
+        db.insert(Student).values(**{name: doc[name] for name in archive.STUDENT_FIELDS}).returning(Student.id)
+    ).scalar()
+    for response in doc["responses"]:
+        response_id = conn.execute(
+            db.insert(Response)
+            .values(student_id=student_id, **{name: response[name] for name in archive.RESPONSE_FIELDS})
+            .returning(Response.id)
+        ).scalar()
+        for attempt in response["attempts"]:
+            attempt_id = conn.execute(
+                db.insert(Attempt)
+                .values(response_id=response_id, **{name: attempt[name] for name in archive.ATTEMPT_FIELDS})
+                .returning(Attempt.id)
+            ).scalar()
+            if attempt["classifications"]:
+                conn.execute(db.insert(Classification), [
+                    {"attempt_id": attempt_id, "criterion": criterion, "is_met": is_met, "source": source}
+                    for criterion, is_met, source in attempt["classifications"]
+                ])
+    conn.execute(db.delete(ArchivedConversation).where(ArchivedConversation.conversation_id == conversation_id))
+    return True
+
+# ---------------------------------------------------------------------------
+# Hot cache of active conversations
+#
+# Every /answer starts with get_student_data. Pending conversations are kept
+# in a bounded per-worker LRU together with the version stamp of the row they
+# were read from or written as. A hit costs a single-column version lookup
+# instead of fetching and decoding json_data; if another worker has written
+# the conversation since, the versions differ and the row is reloaded.
+# ---------------------------------------------------------------------------
+
+CONVERSATION_CACHE_ENABLED = os.getenv("CONVERSATION_CACHE", "1") == "1"
+conversation_cache = LRUCache(
+    maxsize=int(os.getenv("CONVERSATION_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "7200")),
+)
+conversation_cache_stale = 0
+_conversation_cache_lock = threading.Lock()
+
+
+def _copy_student_data(student_data):
+    """Copy of student_data that /answer may change without touching the original.
+
+    Only the containers /answer modifies are copied: the top-level dict, the
+    responses list, and the last response with its attempts list.
+    """
+    copied = dict(student_data)
+    responses = list(student_data.get('responses', []))
+    if responses:
+        last = dict(responses[-1])
+        last['attempts'] = list(last.get('attempts', []))
+        responses[-1] = last
+    copied['responses'] = responses
+    return copied
+
+
+def _cache_conversation(conversation_id, version, status, student_data):
+    if not CONVERSATION_CACHE_ENABLED:
+        return
+    if status == 'pending':
+        conversation_cache.set(conversation_id, (version, student_data))
+    else:
+        conversation_cache.pop(conversation_id)
+
+
+def _count_stale_conversation():
+    global conversation_cache_stale
+    with _conversation_cache_lock:
+        conversation_cache_stale += 1
+
+
+def conversation_cache_stats():
+    """Lookups of the conversation cache; stale entries count as misses."""
+    stats = conversation_cache.stats()
+    hits = stats["hits"] - conversation_cache_stale
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "size": stats["size"],
+        "hits": hits,
+        "stale": conversation_cache_stale,
+        "misses": stats["misses"] + conversation_cache_stale,
+        "evictions": stats["evictions"],
+        "hit_rate": hits / lookups if lookups else 0.0,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Write-behind persistence
+#
+# With PERSISTENCE_MODE=write_behind, conversation updates are appended to a
+# per-process journal file (fsynced before the request is answered) and a
+# background thread writes them to the database in batches, one transaction
+# per batch, committed with synchronous=FULL because the journal is emptied
+# right after. Until then get_student_data serves them from memory. Journals
+# left behind by a crashed process are replayed on startup; a checkpoint row
+# per journal, written in the same transaction as each batch, keeps the
+# replay from applying anything twice.
+# ---------------------------------------------------------------------------
+
+PERSISTENCE_MODE = os.getenv("PERSISTENCE_MODE", "sync")
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", os.path.join(INSTANCE_PATH, "journal"))
+
+_journal = None
+_journal_pid = None
+_journal_lock = threading.Lock()
+# conversation_id -> (journal seq, serialized student_data) not yet in the DB
+_unflushed_conversations = {}
+_unflushed_lock = threading.Lock()
+
+_JOURNAL_WRITERS = {
+    "save": lambda conn, r, at: _write_conversation(conn, r["student_data"], r["new_attempt"], at),
+    "end_session": lambda conn, r, at: _write_session_end(conn, r["conversation_id"], r["is_temporary"], at),
+    "resume": lambda conn, r, at: _write_session_resume(conn, r["conversation_id"]),
+    "cache": _write_cache_entry,
+}
+
+
+def get_journal():
+    """The journal of this process, created (after replaying orphans) on first use.
+
+    The first call must be made in an app context; the journal keeps using its app.
+    """
+    global _journal
+    if _journal is not None and _journal_pid == os.getpid():
+        return _journal
+    with _journal_lock:
+        if _journal is None or _journal_pid != os.getpid():
+            _start_journal()
+    return _journal
+
+
+def _start_journal():
+    global _journal, _journal_pid
+    _unflushed_conversations.clear()
+    replayed = replay_orphans(JOURNAL_DIR, _apply_journal_batch, _journal_checkpoint, _forget_journal)
+    if replayed:
+        logger.info("Replayed %d journaled writes", replayed)
+    # The writer thread has no app context of its own; it uses this one's app.
+    app = current_app._get_current_object()
+    _journal = WriteJournal(
+        JOURNAL_DIR,
+        functools.partial(_apply_journal_batch_in, app),
+        flush_interval=float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05")),
+        max_batch=int(os.getenv("JOURNAL_MAX_BATCH", "256")),
+    )
+    _journal.on_applied = _forget_applied
+    _journal_pid = os.getpid()
+    atexit.register(_journal.close)
+
+
+def _journal_write(record, student_data=None, sync=True):
+    record["at"] = _now().isoformat()
+    journal = get_journal()
+    seq = journal.append(record, sync=sync)
+    if student_data is not None:
+        conversation_id = student_data['conversation_id']
+        serialized = json.dumps(student_data)
+        with _unflushed_lock:
+            # A concurrent save of the same conversation may have got a
+            # later seq and stored its entry first.
+            entry = _unflushed_conversations.get(conversation_id)
+            if entry is None or entry[0] < seq:
+                _unflushed_conversations[conversation_id] = (seq, serialized)
+        # The writer may have applied the record before the entry above
+        # existed; in that case nobody else will drop it.
+        if journal.applied_seq >= seq:
+            _drop_unflushed(conversation_id, seq)
+
+
+def _drop_unflushed(conversation_id, seq):
+    with _unflushed_lock:
+        entry = _unflushed_conversations.get(conversation_id)
+        if entry is not None and entry[0] <= seq:
+            del _unflushed_conversations[conversation_id]
+
+
+def _forget_applied(batch):
+    for seq, record in batch:
+        if record["op"] == "save":
+            _drop_unflushed(record["student_data"]["conversation_id"], seq)
+            # The write bumped the version, so a cached copy is now stale.
+            conversation_cache.pop(record["student_data"]["conversation_id"])
+
+
+def _apply_journal_batch_in(app, records, journal_name, last_seq):
+    with app.app_context():
+        _apply_journal_batch(records, journal_name, last_seq)
+
+
+def _apply_journal_batch(records, journal_name, last_seq):
+    """Write a batch of journal records and its checkpoint in one transaction."""
+    try:
+        _commit_durably(_write_journal_records, records, journal_name, last_seq)
+    except OperationalError:
+        raise  # Locked or unavailable: the writer retries the batch
+    except Exception as exc:
+        if len(records) == 1:
+            if isinstance(exc, IntegrityError) and records[0]["op"] == "save":
+                # The same answer, stored first by another worker process
+                logger.info("Skipping journal record %s #%s: attempt already stored", journal_name, last_seq)
             else:
-                response.final_unmet_criteria = response_data.get('unmet_criteria', [])
-
-            # Save attempts
-            for j, attempt_data in enumerate(response_data['attempts']):
-                attempt = Attempt.query.filter_by(response_id=response.id, attempt_number=j+1).first()
-                if not attempt:
-                    question_text = response_data['question_text'] if j == 0 else response_data['attempts'][j-1].get('next_followup_question', '')
-                    attempt = Attempt(
-                        response_id=response.id,
-                        attempt_number=j+1,
-                        response_type=attempt_data['response_type'],
-                        question_text=question_text,
-                        response_text=attempt_data['response'],
-                        unmet_criteria=attempt_data.get('unmet_criteria', [])
-                    )
-                    db.session.add(attempt)
-                else:
-                    attempt.response_text = attempt_data['response']
-                    attempt.unmet_criteria = attempt_data.get('unmet_criteria', [])
-
-                # Save classifications
-                for criterion, is_met in attempt_data['classification'].items():
-                    classification = Classification.query.filter_by(attempt_id=attempt.id, criterion=criterion).first()
-                    if not classification:
-                        classification = Classification(
-                            attempt_id=attempt.id,
-                            criterion=criterion,
-                            is_met=(is_met.lower() == 'true') if isinstance(is_met, str) else bool(is_met)
-                        )
-                        db.session.add(classification)
-                    else:
-                        classification.is_met = (is_met.lower() == 'true') if isinstance(is_met, str) else bool(is_met)
-
-        db.session.commit()
-        print(f"Saved data for student {student.id}")
+                logger.exception("Dropping journal record %s #%s: %r", journal_name, last_seq, records[0])
+            _commit_durably(_write_journal_records, [], journal_name, last_seq)
+            return
+        # Isolate the bad record so the rest of the batch still lands.
+        first_seq = last_seq - len(records) + 1
+        for offset, record in enumerate(records):
+            _apply_journal_batch([record], journal_name, first_seq + offset)
+
+
+def _write_journal_records(conn, records, journal_name, last_seq):
+    for record in records:
+        _JOURNAL_WRITERS[record["op"]](conn, record, datetime.fromisoformat(record["at"]))
+    updated = conn.execute(
+        db.update(JournalCheckpoint)
+        .where(JournalCheckpoint.journal == journal_name)
+        .values(seq=last_seq)
+    ).rowcount
+    if not updated:
+        conn.execute(db.insert(JournalCheckpoint).values(journal=journal_name, seq=last_seq))
+
+
+def _journal_checkpoint(journal_name):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(JournalCheckpoint.seq).where(JournalCheckpoint.journal == journal_name)
+        ).scalar() or 0
+
+
+def _forget_journal(journal_name):
+    with db.engine.begin() as conn:
+        conn.execute(db.delete(JournalCheckpoint).where(JournalCheckpoint.journal == journal_name))
+
+
+def start_journal(app):
+    """Replay orphaned journals and start this process's journal, in write-behind mode.
+
+    Called as a worker boots (post_worker_init in gunicorn.conf.py), so the
+    writes a dead worker acknowledged reach the database before it serves.
+    """
+    if PERSISTENCE_MODE == 'write_behind':
+        with app.app_context():
+            get_journal()
+
+
+if PERSISTENCE_MODE == 'write_behind':
+    @bp.before_app_request
+    def _ensure_journal():
+        # For servers that do not call start_journal when a worker boots
+        get_journal()
 
 # ---------------------------------------------------------------------------
 # Helper: build end-of-conversation response
@@ -295,37 +1834,316 @@ END_MESSAGES = {
 }
 
 def _end_conversation(student_data, lang):
-    """Mark conversation completed and return end JSON."""
+    """Mark conversation completed and return the end payload."""
     student_data['conversation_status'] = 'completed'
-    save_student_data(student_data)
-    return jsonify({"end": True, "message": END_MESSAGES[lang]})
+    return {"end": True, "message": END_MESSAGES[lang]}
 
-def _next_question_response(student_data, question_index, lang):
-    """Return the next main question JSON."""
-    return jsonify({
-        "student_data": student_data,
+def _next_question_response(question_index, lang):
+    """Return the next main question payload."""
+    return {
         "question_index": question_index,
         "attempt": 0,
         "question": questions[question_index]["question"][lang],
-    })
+    }
+
+# ---------------------------------------------------------------------------
+# Helper: the steps of answering a question, shared by /answer and
+# /answer/stream
+# ---------------------------------------------------------------------------
+
+def _begin_answer(student_data, question_index, attempt):
+    """Set up the question being answered; return (question_data, unmet_criteria)."""
+    lang = student_data['language']
+    current_question = questions[question_index]
+    question_id = f"question{question_index + 1}"
+
+    # First attempt: create new question_data; otherwise retrieve existing
+    if attempt == 0:
+        unmet_criteria = current_question["criteria"]
+        question_data = {
+            "question_id": question_id,
+            "question_text": current_question["question"][lang],
+            "attempts": [],
+            "unmet_criteria": unmet_criteria,
+        }
+        student_data["responses"].append(question_data)
+    else:
+        question_data = student_data["responses"][-1]
+        unmet_criteria = question_data.get("unmet_criteria", current_question["criteria"])
+
+    return question_data, unmet_criteria
+
+def _build_attempt(question_data, attempt, response_text, unmet_criteria, classification, graded_locally=()):
+    """Record the classification outcome on question_data and return the attempt."""
+    response_type = "main" if attempt == 0 else "followup"
+    attempt_data = {
+        "attempt_number": attempt + 1,
+        "response_type": response_type,
+        "response": response_text,
+        "classification": classification,
+        "unmet_criteria": [
+            criterion for criterion in unmet_criteria
+            if str(classification.get(criterion, "False")).lower() != "true"
+        ],
+    }
+    if graded_locally:
+        attempt_data["graded_locally"] = list(graded_locally)
+    question_data["unmet_criteria"] = attempt_data["unmet_criteria"]
+    return attempt_data
+
+def _needs_followup(attempt_data, attempt):
+    """A follow-up is only asked while criteria are unmet and attempts remain."""
+    return bool(attempt_data["unmet_criteria"]) and attempt < 2
+
+def _answer_payload(student_data, question_index, attempt, attempt_data):
+    """The next step after attempt_data: a follow-up, the next question or the end."""
+    lang = student_data['language']
+    if _needs_followup(attempt_data, attempt):
+        return {
+            "question_index": question_index,
+            "attempt": attempt + 1,
+            "question": attempt_data["next_followup_question"],
+        }
+    if question_index < len(questions) - 1:
+        return _next_question_response(question_index + 1, lang)
+    return _end_conversation(student_data, lang)
+
+def _finish_answer(student_data, question_index, attempt, attempt_data):
+    """Append the attempt, persist the conversation once and return the next step."""
+    student_data["responses"][-1]["attempts"].append(attempt_data)
+    payload = _answer_payload(student_data, question_index, attempt, attempt_data)
+    try:
+        save_student_data(student_data, new_attempt=attempt_data)
+    except IntegrityError:
+        # A duplicate of this answer in another worker process was stored
+        # first (_answer_flight only merges those of this process). The
+        # unique indexes rolled this write back; answer as that one did.
+        stored_data = get_student_data(student_data['conversation_id'])
+        stored = _stored_attempt(stored_data, question_index, attempt)
+        if stored is None:
+            raise
+        return _replay_answer(stored_data, question_index, attempt, stored)
+    return payload
+
+def _request_conversation_id(data):
+    """The conversation an /answer request is about.
+
+    The browser sends only ``conversation_id``; older pages still send the
+    whole ``student_data``, of which only the id is used.
+    """
+    if 'conversation_id' in data:
+        conversation_id = data['conversation_id']
+    else:
+        conversation_id = data['student_data']['conversation_id']
+    _current_trace()["conversation_id"] = conversation_id
+    return conversation_id
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ---------------------------------------------------------------------------
+# Idempotent /answer
+#
+# An answer is identified by (conversation_id, question_index, attempt).
+# Double-clicks and browser retries repeat that key: a repeat that arrives
+# while the first request is still being graded waits for it, and a repeat
+# of an answer that is already stored gets the stored outcome back. Neither
+# calls the LLM or appends another attempt.
+#
+# Waiting is per worker process. Across workers the stored-attempt check
+# still applies, because get_student_data sees every committed write.
+# ---------------------------------------------------------------------------
+
+_answer_flights = {}
+_answer_flights_lock = threading.Lock()
+answer_dedup_counts = {"replayed": 0, "coalesced": 0}
+
+
+def _count_answer_dedup(kind):
+    with _answer_flights_lock:
+        answer_dedup_counts[kind] += 1
+
+
+@contextlib.contextmanager
+def _answer_flight(conversation_id, question_index, attempt):
+    """Hold the answer key; duplicates of it wait until the holder is done."""
+    key = (conversation_id, question_index, attempt)
+    waited = False
+    while True:
+        with _answer_flights_lock:
+            done = _answer_flights.get(key)
+            if done is None:
+                done = _answer_flights[key] = threading.Event()
+                break
+        waited = True
+        done.wait()
+    if waited:
+        _count_answer_dedup("coalesced")
+    try:
+        yield
+    finally:
+        with _answer_flights_lock:
+            del _answer_flights[key]
+        done.set()
+
+
+def _stored_attempt(student_data, question_index, attempt):
+    """The attempt already recorded for this key, or None."""
+    responses = student_data["responses"]
+    if question_index < len(responses):
+        attempts = responses[question_index]["attempts"]
+        if attempt < len(attempts):
+            return attempts[attempt]
+    return None
+
+
+def _replay_answer(student_data, question_index, attempt, attempt_data):
+    """The payload the original request for a stored attempt returned."""
+    _count_answer_dedup("replayed")
+    return _answer_payload(student_data, question_index, attempt, attempt_data)
+
+
+def answer_dedup_stats():
+    with _answer_flights_lock:
+        return {"in_flight": len(_answer_flights), **answer_dedup_counts}
+
+# ---------------------------------------------------------------------------
+# Bulk export
+#
+# One record per attempt, with the conversation and question it belongs to
+# and its verdicts; conversations without answers get one record with the
+# attempt fields empty. Rows are read with a server-side cursor in id order
+# and grouped per attempt as they arrive, so an export of any size streams in
+# constant memory. /export requires EXPORT_TOKEN as a bearer token and is
+# disabled while it is unset; `flask export-conversations` needs no token.
+# ---------------------------------------------------------------------------
+
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+EXPORT_BATCH_ROWS = 1000
+EXPORT_ARCHIVE_BATCH = 100
+
+EXPORT_FIELDS = [
+    "conversation_id", "name", "email", "language", "conversation_status", "start_time", "end_time",
+    "question_number", "question_text", "final_unmet_criteria",
+    "attempt_number", "response_type", "followup_question", "response_text", "unmet_criteria",
+    "classification", "graded_locally",
+]
+
+
+def export_records(since=None, until=None, status=None, language=None):
+    """Yield export records of the conversations started in [since, until)."""
+    stmt = (
+        db.select(
+            Student.id.label("student_id"), Student.conversation_id, Student.name, Student.email,
+            Student.language, Student.conversation_status, Student.start_time, Student.end_time,
+            Response.question_number, Response.question_text, Response.final_unmet_criteria,
+            Attempt.id.label("attempt_id"), Attempt.attempt_number, Attempt.response_type,
+            Attempt.question_text.label("attempt_question_text"), Attempt.response_text,
+            Attempt.unmet_criteria, Classification.criterion, Classification.is_met, Classification.source,
+        )
+        .outerjoin(Response, Response.student_id == Student.id)
+        .outerjoin(Attempt, Attempt.response_id == Response.id)
+        .outerjoin(Classification, Classification.attempt_id == Attempt.id)
+        .order_by(Student.id, Response.question_number, Attempt.attempt_number, Attempt.id, Classification.id)
+    )
+    stmt = stmt.where(*_export_filters(Student, since, until, status, language))
+    archived = (
+        db.select(ArchivedConversation.data)
+        .where(*_export_filters(ArchivedConversation, since, until, status, language))
+        .order_by(ArchivedConversation.id)
+    )
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(stmt)
+        record = None
+        current = None
+        for row in result:
+            key = (row.student_id, row.attempt_id)
+            if key != current:
+                if record is not None:
+                    yield record
+                current = key
+                record = _export_record(row)
+            if row.criterion is not None:
+                record["classification"][row.criterion] = row.is_met
+                if row.source == 'local':
+                    record["graded_locally"].append(row.criterion)
+        if record is not None:
+            yield record
+        # Archived conversations follow, decompressed one at a time
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_ARCHIVE_BATCH).execute(archived)
+        for data in result.scalars():
+            yield from archive.export_records(archive.unpack(data))
+
+
+def _export_filters(model, since, until, status, language):
+    """Conditions on Student or ArchivedConversation, which share these columns."""
+    conditions = []
+    if since is not None:
+        conditions.append(model.start_time >= since)
+    if until is not None:
+        conditions.append(model.start_time < until)
+    if status:
+        conditions.append(model.conversation_status == status)
+    if language:
+        conditions.append(model.language == language)
+    return conditions
+
+
+def _export_record(row):
+    is_followup = row.attempt_number is not None and row.attempt_number > 1
+    return {
+        "conversation_id": row.conversation_id,
+        "name": row.name,
+        "email": row.email,
+        "language": row.language,
+        "conversation_status": row.conversation_status,
+        "start_time": row.start_time,
+        "end_time": row.end_time,
+        "question_number": row.question_number,
+        "question_text": row.question_text,
+        "final_unmet_criteria": row.final_unmet_criteria,
+        "attempt_number": row.attempt_number,
+        "response_type": row.response_type,
+        "followup_question": row.attempt_question_text if is_followup else None,
+        "response_text": row.response_text,
+        "unmet_criteria": row.unmet_criteria,
+        "classification": {},
+        "graded_locally": [],
+    }
+
+
+def _export_authorized():
+    return _bearer_authorized(EXPORT_TOKEN)
+
+
+def _bearer_authorized(expected):
+    if not expected:
+        return False
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def _parse_export_date(value):
+    return datetime.fromisoformat(value) if value else None
 
 # ---------------------------------------------------------------------------
 # Routes
 # ---------------------------------------------------------------------------
 
-@app.route('/')
+@bp.route('/')
 def index():
     session.clear()
     session['language'] = None
     return render_template('index.html')
 
-@app.route('/set_language', methods=['POST'])
+@bp.route('/set_language', methods=['POST'])
 def set_language():
     lang = request.json['language']
     session['language'] = lang
     return jsonify({"success": True})
 
-@app.route('/start', methods=['POST'])
+@bp.route('/start', methods=['POST'])
 def start():
     data = request.json
     lang = session.get('language', 'en')
@@ -338,83 +2156,101 @@ def start():
     }
     save_student_data(student_data)
     return jsonify({
-        "student_data": student_data,
+        "conversation_id": student_data['conversation_id'],
         "question_index": 0,
         "attempt": 0,
         "question": questions[0]["question"][lang],
     })
 
-@app.route('/answer', methods=['POST'])
+@bp.route('/answer', methods=['POST'])
 def answer():
     data = request.json
     question_index = data['question_index']
     attempt = data['attempt']
     response_text = data['response']
-    student_data = get_student_data(data['student_data']['conversation_id'])
-    if not student_data:
-        return jsonify({"error": "Student data not found"}), 404
+    conversation_id = _request_conversation_id(data)
 
-    lang = student_data['language']
-    current_question = questions[question_index]
-    question_id = f"question{question_index + 1}"
+    with _answer_flight(conversation_id, question_index, attempt):
+        student_data = get_student_data(conversation_id)
+        if not student_data:
+            return jsonify({"error": "Student data not found"}), 404
 
-    # First attempt: create new question_data; otherwise retrieve existing
-    if attempt == 0:
-        unmet_criteria = current_question["criteria"]
-        question_data = {
-            "question_id": question_id,
-            "question_text": current_question["question"][lang],
-            "attempts": [],
-            "unmet_criteria": unmet_criteria,
-        }
-        student_data["responses"].append(question_data)
-    else:
-        question_data = student_data["responses"][-1]
-        unmet_criteria = question_data.get("unmet_criteria", current_question["criteria"])
+        stored = _stored_attempt(student_data, question_index, attempt)
+        if stored is not None:
+            return jsonify(_replay_answer(student_data, question_index, attempt, stored))
 
-    # Classify the response
-    classification = classify_response(response_text, unmet_criteria, lang)
+        lang = student_data['language']
+        question_data, unmet_criteria = _begin_answer(student_data, question_index, attempt)
 
-    response_type = "main" if attempt == 0 else "followup"
-    attempt_data = {
-        "attempt_number": attempt + 1,
-        "response_type": response_type,
-        "response": response_text,
-        "classification": classification,
-        "unmet_criteria": [
-            criterion for criterion in unmet_criteria
-            if str(classification.get(criterion, "False")).lower() != "true"
-        ],
-    }
+        # Classify the response
+        classification, graded_locally = grade_response(response_text, unmet_criteria, lang)
+        attempt_data = _build_attempt(
+            question_data, attempt, response_text, unmet_criteria, classification, graded_locally)
 
-    question_data["unmet_criteria"] = attempt_data["unmet_criteria"]
-    all_criteria_met = len(question_data["unmet_criteria"]) == 0
+        if _needs_followup(attempt_data, attempt):
+            followup = generate_followup(response_text, attempt_data["unmet_criteria"], lang)
+            attempt_data["next_followup_question"] = followup
 
-    if not all_criteria_met:
-        followup = generate_followup(response_text, question_data["unmet_criteria"], lang)
-        attempt_data["next_followup_question"] = followup
+        return jsonify(_finish_answer(student_data, question_index, attempt, attempt_data))
 
-    student_data["responses"][-1]["attempts"].append(attempt_data)
-    save_student_data(student_data)
+@bp.route('/answer/stream', methods=['POST'])
+def answer_stream():
+    """Server-sent events variant of /answer.
 
-    # Decide next step
-    move_to_next = all_criteria_met or attempt >= 2
+    Emits ``classification`` as soon as the response is graded, then one
+    ``token`` event per follow-up chunk, and finally ``done`` carrying the same
+    payload /answer would return.  The conversation is saved once, before
+    ``done``.  A repeat of an answer that is already stored gets its
+    ``classification`` and ``done`` events without any ``token``.
+    """
+    data = request.json
+    question_index = data['question_index']
+    attempt = data['attempt']
+    response_text = data['response']
+    conversation_id = _request_conversation_id(data)
+    if not get_student_data(conversation_id):
+        return jsonify({"error": "Student data not found"}), 404
 
-    if move_to_next:
-        if question_index < len(questions) - 1:
-            return _next_question_response(student_data, question_index + 1, lang)
-        else:
-            return _end_conversation(student_data, lang)
-    else:
-        # Still have follow-up attempts left
-        return jsonify({
-            "student_data": student_data,
-            "question_index": question_index,
-            "attempt": attempt + 1,
-            "question": attempt_data["next_followup_question"],
+    def classification_event(attempt_data):
+        return _sse("classification", {
+            "classification": attempt_data["classification"],
+            "unmet_criteria": attempt_data["unmet_criteria"],
+            "followup": _needs_followup(attempt_data, attempt),
         })
 
-@app.route('/download-chat', methods=['POST'])
+    def events():
+        with _answer_flight(conversation_id, question_index, attempt):
+            # Loaded again under the key: a duplicate may have finished since
+            student_data = get_student_data(conversation_id)
+            lang = student_data['language']
+            stored = _stored_attempt(student_data, question_index, attempt)
+            if stored is not None:
+                yield classification_event(stored)
+                yield _sse("done", _replay_answer(student_data, question_index, attempt, stored))
+                return
+
+            question_data, unmet_criteria = _begin_answer(student_data, question_index, attempt)
+            classification, graded_locally = grade_response(response_text, unmet_criteria, lang)
+            attempt_data = _build_attempt(
+                question_data, attempt, response_text, unmet_criteria, classification, graded_locally)
+            yield classification_event(attempt_data)
+
+            if _needs_followup(attempt_data, attempt):
+                chunks = []
+                for chunk in stream_followup(response_text, attempt_data["unmet_criteria"], lang):
+                    if chunk:  # The usage arrives in a final empty chunk
+                        chunks.append(chunk)
+                        yield _sse("token", {"text": chunk})
+                attempt_data["next_followup_question"] = "".join(chunks).strip()
+
+            yield _sse("done", _finish_answer(student_data, question_index, attempt, attempt_data))
+
+    return current_app.response_class(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@bp.route('/download-chat', methods=['POST'])
 def download_chat():
     conversation_id = request.json.get('conversation_id')
     student_data = get_student_data(conversation_id)
@@ -432,55 +2268,104 @@ def download_chat():
     }
     t = translations[lang]
 
-    chat_content = f"{t['chat_conversation']} {student_data['name']} ({student_data['email']})\n\n"
+    parts = [f"{t['chat_conversation']} {student_data['name']} ({student_data['email']})\n\n"]
 
     for i, resp in enumerate(student_data['responses'], 1):
-        chat_content += f"{t['question']} {i}: {resp['question_text']}\n\n"
+        parts.append(f"{t['question']} {i}: {resp['question_text']}\n\n")
         for j, att in enumerate(resp['attempts'], 1):
-            if j == 1:
-                chat_content += f"{user_name}: {att['response']}\n\n"
-            else:
+            if j > 1:
                 followup_question = resp['attempts'][j-2].get('next_followup_question', 'N/A')
-                chat_content += f"{t['followup']} {j-1} {t['for_question']} {i}: {followup_question}\n\n"
-                chat_content += f"{user_name}: {att['response']}\n\n"
-        chat_content += "\n"
+                parts.append(f"{t['followup']} {j-1} {t['for_question']} {i}: {followup_question}\n\n")
+            parts.append(f"{user_name}: {att['response']}\n\n")
+        parts.append("\n")
 
-    return chat_content, 200, {
+    return "".join(parts), 200, {
         'Content-Type': 'text/plain; charset=utf-8',
         'Content-Disposition': f'attachment; filename=chat_conversation_{conversation_id}.txt',
     }
 
-@app.route('/end_session', methods=['POST'])
+@bp.route('/export', methods=['GET'])
+def export():
+    """Stream every conversation as NDJSON or CSV, optionally zstd-compressed.
+
+    Query parameters: ``format`` (ndjson, csv), ``compression`` (none, zstd),
+    ``since`` and ``until`` (ISO dates, on the conversation's start time),
+    ``status`` and ``language``.
+    """
+    if not _export_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    fmt = request.args.get('format', 'ndjson')
+    compression = request.args.get('compression', 'none')
+    if fmt not in export_formats.FORMATS or compression not in export_formats.COMPRESSIONS:
+        return jsonify({"error": "Unsupported format or compression"}), 400
+    try:
+        since = _parse_export_date(request.args.get('since'))
+        until = _parse_export_date(request.args.get('until'))
+    except ValueError:
+        return jsonify({"error": "since and until must be ISO dates"}), 400
+
+    records = export_records(since, until, request.args.get('status'), request.args.get('language'))
+    body = export_formats.export_stream(records, EXPORT_FIELDS, fmt, compression)
+    mimetype = 'application/zstd' if compression == 'zstd' else export_formats.CONTENT_TYPES[fmt]
+    return current_app.response_class(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={export_formats.filename(fmt, compression)}',
+        'X-Accel-Buffering': 'no',
+    })
+
+@bp.route('/analytics', methods=['GET'])
+def analytics():
+    """Summary statistics per language (optionally only ``?language=``).
+
+    Served from the summary tables; uses the same bearer token as /export.
+    """
+    if not _export_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(analytics_summary(request.args.get('language')))
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Metrics of this worker process in the Prometheus text format.
+
+    Open unless METRICS_TOKEN is set, in which case it is required as a
+    bearer token.
+    """
+    if METRICS_TOKEN and not _bearer_authorized(METRICS_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 401
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/end_session', methods=['POST'])
 def end_session():
     data = request.json
     conversation_id = data.get('conversation_id')
     is_temporary = data.get('is_temporary', False)
 
     if conversation_id:
-        with app.app_context():
-            student = Student.query.filter_by(conversation_id=conversation_id).first()
-            if student and student.conversation_status != 'completed':
-                cet = pytz.timezone('Europe/Berlin')
-                student.end_time = datetime.now(cet)
-                if not is_temporary:
-                    student.conversation_status = 'interrupted'
-                db.session.commit()
+        if PERSISTENCE_MODE == 'write_behind':
+            _journal_write({
+                "op": "end_session",
+                "conversation_id": conversation_id,
+                "is_temporary": is_temporary,
+            })
+        else:
+            _commit_now(_write_session_end, conversation_id, is_temporary, _now())
 
     return jsonify({"success": True})
 
-@app.route('/resume_session', methods=['POST'])
+@bp.route('/resume_session', methods=['POST'])
 def resume_session():
     data = request.json
     conversation_id = data.get('conversation_id')
 
     if conversation_id:
-        with app.app_context():
-            student = Student.query.filter_by(conversation_id=conversation_id).first()
-            if student and student.conversation_status != 'completed':
-                student.end_time = None
-                student.conversation_status = 'pending'
-                db.session.commit()
-                return jsonify({"success": True, "student_data": student.json_data})
+        if PERSISTENCE_MODE == 'write_behind':
+            student_data = get_student_data(conversation_id)
+            if student_data is not None and student_data.get('conversation_status') != 'completed':
+                _journal_write({"op": "resume", "conversation_id": conversation_id})
+                return jsonify({"success": True, "student_data": student_data})
+        else:
+            student_data = _commit_now(_write_session_resume, conversation_id)
+            if student_data is not None:
+                return jsonify({"success": True, "student_data": student_data})
 
     return jsonify({"success": False})
 
@@ -488,10 +2373,188 @@ def resume_session():
 # Initialization
 # ---------------------------------------------------------------------------
 
+# Non-unique indexes of earlier versions, dropped once their unique
+# replacement exists.
+_REPLACED_INDEXES = {
+    'ix_response_student_question': 'uq_response_student_question',
+    'ix_attempt_response_number': 'uq_attempt_response_number',
+}
+
+
 def create_tables():
+    """Create missing tables, and missing columns and indexes on tables that already exist.
+
+    Runs in an app context: `flask init-db`, gunicorn.conf.py and __main__ push one.
+    """
+    new_summaries = not db.inspect(db.engine).has_table(ConversationSummary.__tablename__)
+    db.create_all()
+    student_columns = {c['name'] for c in db.inspect(db.engine).get_columns('student')}
+    if 'version' not in student_columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE student ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+    classification_columns = {c['name'] for c in db.inspect(db.engine).get_columns('classification')}
+    if 'source' not in classification_columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE classification ADD COLUMN source VARCHAR(16) NOT NULL DEFAULT 'llm'"))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+            except IntegrityError:
+                logger.warning("Index %s not created: %s has duplicate rows", index.name, table.name)
+    inspector = db.inspect(db.engine)
+    existing = {index['name'] for table in ('response', 'attempt') for index in inspector.get_indexes(table)}
+    for old, new in _REPLACED_INDEXES.items():
+        if old in existing and new in existing:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f"DROP INDEX {old}"))
+    if new_summaries:
+        # Existing conversations are counted once; later writes keep it up to date
+        rebuild_analytics()
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and indexes."""
+    create_tables()
+    click.echo("Database initialized")
+
+@bp.cli.command('clear-classification-cache')
+@click.option('--stale-only', is_flag=True, help='Only drop entries of other prompt versions or models.')
+@click.option('--older-than-days', type=int, help='Only drop entries cached more than this many days ago.')
+def clear_classification_cache_command(stale_only, older_than_days):
+    """Invalidate cached classification verdicts."""
+    removed = invalidate_classification_cache(stale_only=stale_only, older_than_days=older_than_days)
+    click.echo(f"Removed {removed} cached classifications")
+
+@bp.cli.command('export-conversations')
+@click.option('--format', 'fmt', type=click.Choice(export_formats.FORMATS), default='ndjson', show_default=True)
+@click.option('--compression', type=click.Choice(export_formats.COMPRESSIONS), default='none', show_default=True)
+@click.option('--output', type=click.File('wb'), default='-', help='File to write (default: stdout).')
+@click.option('--since', type=click.DateTime(), help='Conversations started on or after this date.')
+@click.option('--until', type=click.DateTime(), help='Conversations started before this date.')
+@click.option('--status', type=click.Choice(['pending', 'interrupted', 'completed']))
+@click.option('--language', type=click.Choice(['en', 'de', 'es', 'et']))
+def export_conversations_command(fmt, compression, output, since, until, status, language):
+    """Stream all conversations, one record per attempt."""
+    records = export_records(since, until, status, language)
+    for chunk in export_formats.export_stream(records, EXPORT_FIELDS, fmt, compression):
+        output.write(chunk)
+
+@bp.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute the analytics summary tables from the stored conversations."""
+    rebuild_analytics()
+    click.echo("Analytics rebuilt")
+
+@bp.cli.command('archive-conversations')
+@click.option('--older-than-days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help='Archive completed and interrupted conversations that ended more than this many days ago.')
+@click.option('--batch-size', default=ARCHIVE_BATCH, show_default=True, help='Conversations per transaction.')
+def archive_conversations_command(older_than_days, batch_size):
+    """Move old finished conversations to the compressed archive."""
+    result = archive_conversations(older_than_days, batch_size)
+    click.echo(f"Archived {result['conversations']} conversations: {result['rows']} rows removed, "
+               f"{result['bytes'] / 1e6:.2f} MB compressed")
+    if CLASSIFICATION_CACHE_DB_DAYS:
+        removed = invalidate_classification_cache(older_than_days=CLASSIFICATION_CACHE_DB_DAYS)
+        click.echo(f"Removed {removed} cached classifications older than {CLASSIFICATION_CACHE_DB_DAYS} days")
+
+@bp.cli.command('train-grader')
+@click.option('--output', default=LOCAL_GRADER_MODEL, show_default=True, help='Where to write the model.')
+@click.option('--min-count', default=2, show_default=True, help='Ignore words seen fewer times.')
+def train_grader_command(output, min_count):
+    """Train the local grader's model from stored LLM verdicts."""
+    examples = (
+        (response_text, criterion, is_met)
+        for response_text, _lang, verdicts in _grader_examples()
+        for criterion, is_met in verdicts.items()
+    )
+    model = NaiveBayesGrader.train(examples, min_count=min_count)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    model.save(output)
+    click.echo(f"Trained on {len(model.models)} criteria, {model.vocabulary_size} words; saved to {output}")
+
+@bp.cli.command('evaluate-grader')
+@click.option('--holdout', default=20, show_default=True,
+              help='Percent of attempts held out for evaluation; the model is trained on the rest.')
+@click.option('--unmet-below', default=LOCAL_GRADER_UNMET_BELOW, show_default=True)
+@click.option('--met-above', default=LOCAL_GRADER_MET_ABOVE, show_default=True)
+def evaluate_grader_command(holdout, unmet_below, met_above):
+    """Measure agreement of the local grader with stored LLM verdicts."""
+    model = NaiveBayesGrader.train(
+        (response_text, criterion, is_met)
+        for response_text, _lang, verdicts in _grader_examples(holdout)
+        for criterion, is_met in verdicts.items()
+    )
+    held_out = list(_grader_examples(holdout, evaluate=True))
+    click.echo(f"{len(held_out)} held-out attempts, "
+               f"{sum(len(v) for _, _, v in held_out)} verdicts")
+    click.echo(f"{'grader':<10} {'thresholds':<12} {'coverage':>8} {'agreement':>9} "
+               f"{'false met':>9} {'false unmet':>11} {'no LLM call':>11}")
+    heuristic = HeuristicGrader(min_words=LOCAL_GRADER_MIN_WORDS)
+    settings = [('heuristic', [heuristic], unmet_below, met_above)]
+    for low, high in sorted({(unmet_below, met_above), (0.01, 0.99), (0.05, 0.95), (0.1, 0.9)}):
+        settings.append(('tiered', [heuristic, model], low, high))
+    for name, tiers, low, high in settings:
+        result = evaluate_grader(TieredGrader(tiers, unmet_below=low, met_above=high), held_out)
+        click.echo(f"{name:<10} {f'{low:g}/{high:g}':<12} {result['coverage']:>8.1%} "
+                   f"{result['agreement']:>9.1%} {result.get('false_met', 0):>9} "
+                   f"{result.get('false_unmet', 0):>11} {result.get('responses_local', 0):>11}")
+
+# ---------------------------------------------------------------------------
+# Application factory
+#
+# Importing this module builds nothing that holds a connection: the database
+# engine belongs to the app create_app() makes, and the LLM clients are built
+# on the first call in each process. `gunicorn 'app:create_app()'` makes one
+# app per worker; `gunicorn app:app` and `flask --app app` use the module's
+# `app`, created on first access.
+# ---------------------------------------------------------------------------
+
+def create_app(config=None):
+    """Create the Flask app; ``config`` overrides settings from the environment."""
+    app = Flask(__name__, instance_path=INSTANCE_PATH)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY")
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'sqlite:///students.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.update(config or {})
+    db.init_app(app)
     with app.app_context():
-        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+    # A worker forked from a process that already used the app (e.g. Gunicorn
+    # with preload_app) must not share its pooled connections.
+    os.register_at_fork(after_in_child=functools.partial(_reset_pools_after_fork, weakref.ref(app)))
+    app.register_blueprint(bp)
+    return app
+
+
+def _reset_pools_after_fork(app_ref):
+    app = app_ref()
+    if app is None:
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+_app = None
+_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # The module-level `app`, created on first access.
+    global _app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
 
 if __name__ == '__main__':
-    create_tables()
+    app = create_app()
+    with app.app_context():
+        create_tables()
     app.run(debug=True)
@@ -0,0 +1,110 @@
+"""Compressed documents of archived conversations.
+
+An archived conversation is one JSON document holding its Student row
+(including ``json_data``) and its responses, attempts and classifications,
+compressed with zstd.  :func:`document` builds that document from rows,
+:func:`pack` and :func:`unpack` convert it to and from bytes, and
+:func:`export_records` turns it back into the records of the bulk export.
+
+    {"conversation_id": ..., "name": ..., "start_time": "2024-05-01T09:30:00", ...,
+     "json_data": {...},
+     "responses": [{"question_number": 1, "question_text": ..., "final_unmet_criteria": [...],
+                    "attempts": [{"attempt_number": 1, ..., "classifications": [[criterion, is_met, source]]}]}]}
+"""
+
+import json
+from datetime import datetime
+
+import zstandard
+
+LEVEL = 10
+STUDENT_FIELDS = ("conversation_id", "name", "email", "language", "conversation_status",
+                  "start_time", "end_time", "version", "json_data")
+RESPONSE_FIELDS = ("question_number", "question_text", "final_unmet_criteria")
+ATTEMPT_FIELDS = ("attempt_number", "response_type", "question_text", "response_text", "unmet_criteria")
+_TIMES = ("start_time", "end_time")
+
+
+def document(student, rows):
+    """The archive document of one conversation.
+
+    ``student`` has the attributes in STUDENT_FIELDS.  ``rows`` are its
+    response/attempt/classification rows as an outer join gives them, in
+    order; ``response_id``, ``attempt_id``, ``criterion``, ``is_met`` and
+    ``source`` identify and describe them, the other columns are named as in
+    RESPONSE_FIELDS and ATTEMPT_FIELDS (the attempt's question text as
+    ``attempt_question_text``).
+    """
+    doc = {name: getattr(student, name) for name in STUDENT_FIELDS}
+    for name in _TIMES:
+        if doc[name] is not None:
+            doc[name] = doc[name].isoformat()
+    doc["responses"] = []
+    response_id = attempt_id = None
+    for row in rows:
+        if row.response_id is None:
+            continue
+        if row.response_id != response_id:
+            response_id = row.response_id
+            doc["responses"].append({name: getattr(row, name) for name in RESPONSE_FIELDS} | {"attempts": []})
+        if row.attempt_id is None:
+            continue
+        if row.attempt_id != attempt_id:
+            attempt_id = row.attempt_id
+            attempt = {name: getattr(row, name) for name in ATTEMPT_FIELDS if name != "question_text"}
+            attempt["question_text"] = row.attempt_question_text
+            attempt["classifications"] = []
+            doc["responses"][-1]["attempts"].append(attempt)
+        if row.criterion is not None:
+            doc["responses"][-1]["attempts"][-1]["classifications"].append([row.criterion, row.is_met, row.source])
+    return doc
+
+
+def pack(doc, level=LEVEL):
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def unpack(data):
+    doc = json.loads(zstandard.ZstdDecompressor().decompress(data))
+    for name in _TIMES:
+        if doc[name] is not None:
+            doc[name] = datetime.fromisoformat(doc[name])
+    return doc
+
+
+def _no_attempt():
+    return {
+        "attempt_number": None, "response_type": None, "followup_question": None,
+        "response_text": None, "unmet_criteria": None, "classification": {}, "graded_locally": [],
+    }
+
+
+def export_records(doc):
+    """Yield the export records of an unpacked document, as the export query would."""
+    student = {
+        "conversation_id": doc["conversation_id"],
+        "name": doc["name"],
+        "email": doc["email"],
+        "language": doc["language"],
+        "conversation_status": doc["conversation_status"],
+        "start_time": doc["start_time"],
+        "end_time": doc["end_time"],
+    }
+    if not doc["responses"]:
+        yield student | {name: None for name in RESPONSE_FIELDS} | _no_attempt()
+    for response in doc["responses"]:
+        question = {name: response[name] for name in RESPONSE_FIELDS}
+        if not response["attempts"]:
+            yield student | question | _no_attempt()
+        for attempt in response["attempts"]:
+            yield student | question | {
+                "attempt_number": attempt["attempt_number"],
+                "response_type": attempt["response_type"],
+                "followup_question": attempt["question_text"] if attempt["attempt_number"] > 1 else None,
+                "response_text": attempt["response_text"],
+                "unmet_criteria": attempt["unmet_criteria"],
+                "classification": {criterion: is_met for criterion, is_met, _ in attempt["classifications"]},
+                "graded_locally": [criterion for criterion, _, source in attempt["classifications"]
+                                   if source == 'local'],
+            }
@@ -0,0 +1,97 @@
+"""Micro-batching of concurrent requests that can share one backend call.
+
+``MicroBatcher.submit(key, item)`` blocks until ``item`` has been processed
+and returns its result.  Items submitted under the same ``key`` within
+``max_wait`` seconds of the first one are handed to ``process(key, items)``
+together, which must return one result per item, in order.  A batch is sent
+as soon as it holds ``max_batch`` items, so the wait is bounded by whichever
+cap is reached first.
+
+There is no dispatcher thread: the request that opens a batch waits for the
+window to close and then runs ``process`` on its own thread, while the
+requests that joined it wait for their result.
+"""
+
+import threading
+
+
+class _Slot:
+    __slots__ = ("item", "result", "error", "done")
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    def __init__(self):
+        self.slots = []
+        self.full = threading.Event()
+
+
+class MicroBatcher:
+    """Gather items per key over a short window and process them in one call."""
+
+    def __init__(self, process, max_batch=16, max_wait=0.05):
+        self._process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._open = {}
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    def submit(self, key, item):
+        """Process ``item`` in a batch with its peers under ``key``; return its result."""
+        slot = _Slot(item)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.slots.append(slot)
+            if len(batch.slots) >= self.max_batch:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._run(key, batch.slots)
+
+        slot.done.wait()
+        if slot.error is not None:
+            raise slot.error
+        return slot.result
+
+    def _run(self, key, slots):
+        with self._lock:
+            self.batches += 1
+            self.items += len(slots)
+            self.largest_batch = max(self.largest_batch, len(slots))
+        try:
+            results = self._process(key, [slot.item for slot in slots])
+            if len(results) != len(slots):
+                raise RuntimeError(f"Batch of {len(slots)} items returned {len(results)} results")
+        except Exception as exc:
+            for slot in slots:
+                slot.error = exc
+                slot.done.set()
+            return
+        for slot, result in zip(slots, results):
+            slot.result = result
+            slot.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "largest_batch": self.largest_batch,
+                "mean_batch": self.items / self.batches if self.batches else 0.0,
+            }
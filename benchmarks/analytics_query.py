@@ -0,0 +1,47 @@
+"""Benchmark: /analytics from summary tables against scanning the raw rows.
+
+Grows a throwaway database to each of ``--sizes`` conversations (nine
+attempts each) and times one analytics read served from the summary tables
+against recomputing the same figures from Student/Response/Attempt/
+Classification (what ``flask rebuild-analytics`` does).
+
+    python benchmarks/analytics_query.py --sizes 250 1000 4000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from export_memory import fill
+from harness import load_app
+
+
+def timed(func, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 4000])
+    args = parser.parse_args()
+
+    app_module = load_app(db_path=os.path.join(tempfile.mkdtemp(prefix="reflection-analytics-"), "bench.db"))
+    total = 0
+    print(f"{'conversations':>13} {'attempts':>9} {'summary read':>13} {'raw scan':>10}")
+    for size in sorted(args.sizes):
+        fill(app_module, size - total)
+        total = size
+        with app_module.app.app_context():
+            summary = timed(app_module.analytics_summary)
+            scan = timed(app_module.rebuild_analytics, repeat=1)
+        print(f"{size:>13} {size * 9:>9} {summary * 1000:>11.2f}ms {scan * 1000:>8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
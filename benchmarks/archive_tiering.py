@@ -0,0 +1,108 @@
+"""Benchmark: archiving finished conversations into compressed rows.
+
+Fills a throwaway database with ``--archived`` old completed conversations
+and ``--hot`` pending ones (three questions, three attempts each), then runs
+``archive_conversations``.  Reports the database size (after VACUUM) and
+hot-table rows before and after, the compressed archive size, how fast
+conversations are archived, and the time to load a hot and an archived
+conversation with ``get_student_data``.  Also checks that the export and
+``rebuild_analytics`` give the same result before and after.
+
+    python benchmarks/archive_tiering.py --archived 2000 --hot 200
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from export_memory import fill
+from harness import load_app, percentile
+from run import database_size
+
+HOT_TABLES = ("student", "response", "attempt", "classification")
+
+
+def vacuumed_size(app_module):
+    with app_module.app.app_context(), app_module.db.engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    return database_size(app_module)
+
+
+def load_times(app_module, conversation_ids, repeat):
+    times = []
+    with app_module.app.app_context():
+        for _ in range(repeat):
+            conversation_id = random.choice(conversation_ids)
+            started = time.perf_counter()
+            assert app_module.get_student_data(conversation_id) is not None
+            times.append(time.perf_counter() - started)
+    return times
+
+
+def snapshot(app_module):
+    """Export records (order ignored) and rebuilt analytics."""
+    with app_module.app.app_context():
+        started = time.perf_counter()
+        records = sorted(json.dumps(r, default=str, sort_keys=True) for r in app_module.export_records())
+        export_seconds = time.perf_counter() - started
+        app_module.rebuild_analytics()
+        summary = app_module.analytics_summary()
+    return records, summary, export_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archived", type=int, default=2000)
+    parser.add_argument("--hot", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=500)
+    args = parser.parse_args()
+
+    app_module = load_app(db_path=os.path.join(tempfile.mkdtemp(prefix="reflection-archive-"), "bench.db"),
+                          CONVERSATION_CACHE="0")
+    db, Student = app_module.db, app_module.Student
+    fill(app_module, args.archived)
+    with app_module.app.app_context(), db.engine.begin() as conn:
+        conn.execute(db.update(Student).values(
+            conversation_status='completed', end_time=app_module._now() - timedelta(days=365)))
+        old_ids = list(conn.execute(db.select(Student.conversation_id)).scalars())
+    fill(app_module, args.hot)
+    with app_module.app.app_context(), db.engine.connect() as conn:
+        hot_ids = list(conn.execute(
+            db.select(Student.conversation_id).where(Student.conversation_status == 'pending')).scalars())
+
+    records_before, summary_before, export_before = snapshot(app_module)
+    size_before, rows_before = vacuumed_size(app_module)
+    hot_before = load_times(app_module, hot_ids, args.reads)
+
+    with app_module.app.app_context():
+        started = time.perf_counter()
+        result = app_module.archive_conversations(older_than_days=30)
+        elapsed = time.perf_counter() - started
+
+    size_after, rows_after = vacuumed_size(app_module)
+    hot_after = load_times(app_module, hot_ids, args.reads)
+    archived_reads = load_times(app_module, old_ids, args.reads)
+    records_after, summary_after, export_after = snapshot(app_module)
+
+    print(f"archived {result['conversations']} conversations in {elapsed:.2f}s "
+          f"({result['conversations'] / elapsed:.0f}/s), {result['rows']} rows removed")
+    print(f"database: {size_before / 1e6:.2f}MB -> {size_after / 1e6:.2f}MB after VACUUM; "
+          f"archive blobs {result['bytes'] / 1e6:.2f}MB "
+          f"({result['bytes'] / max(result['conversations'], 1) / 1e3:.1f}kB per conversation)")
+    print("hot table rows: " + "  ".join(
+        f"{table}={rows_before[table]}->{rows_after[table]}" for table in HOT_TABLES))
+    print(f"get_student_data p50/p95: hot {percentile(hot_before, 50) * 1e3:.2f}/"
+          f"{percentile(hot_before, 95) * 1e3:.2f}ms before, {percentile(hot_after, 50) * 1e3:.2f}/"
+          f"{percentile(hot_after, 95) * 1e3:.2f}ms after; archived {percentile(archived_reads, 50) * 1e3:.2f}/"
+          f"{percentile(archived_reads, 95) * 1e3:.2f}ms")
+    print(f"export of {len(records_after)} records: {export_before:.2f}s before, {export_after:.2f}s after")
+    print(f"export unchanged: {records_before == records_after}  "
+          f"rebuilt analytics unchanged: {summary_before == summary_after}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Micro-benchmark: per-call overhead of the LLM helpers, without network.
+
+Compares building the classification/follow-up chain on every call (what
+classify_response and generate_followup used to do) with the chains that
+``build_llm_chains`` prebuilds at startup.  The LLM is the zero-latency fake,
+so the numbers are pure Python overhead.
+
+    python benchmarks/chain_overhead.py --calls 2000
+"""
+
+import argparse
+import time
+
+from harness import load_app
+
+
+def per_call(label, fn, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<48} {elapsed / calls * 1e6:9.1f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    app_module = load_app(CLASSIFICATION_CACHE="0")
+    question = app_module.questions[2]
+    criteria = question["criteria"]
+    unmet = criteria[1:4]
+    inputs = {"response": "We missed the deadline because nobody owned testing.", "lang": "en"}
+
+    def build_classifier():
+        return app_module.ClassifierChain(3, criteria, criteria)
+
+    def build_followup():
+        return app_module.FOLLOWUP_PROMPT | app_module.llm_followup | app_module.StrOutputParser()
+
+    print(f"{args.calls} calls per row, fake LLM without latency")
+    per_call("classifier chain: build only (per call)", build_classifier, args.calls)
+    per_call("classifier chain: prebuilt lookup", lambda: app_module._classifier_chain(criteria), args.calls)
+    per_call("classify: build + invoke (per call)",
+             lambda: build_classifier().chain.invoke(inputs), args.calls)
+    per_call("classify: prebuilt invoke",
+             lambda: app_module._classify_with_llm(inputs["response"], criteria, "en"), args.calls)
+    per_call("follow-up: build + invoke (per call)",
+             lambda: build_followup().invoke({**inputs, "criteria": ", ".join(unmet)}), args.calls)
+    per_call("follow-up: prebuilt invoke",
+             lambda: app_module.generate_followup(inputs["response"], unmet, "en"), args.calls)
+
+
+if __name__ == '__main__':
+    main()
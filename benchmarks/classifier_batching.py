@@ -0,0 +1,98 @@
+"""Benchmark: classification with and without the micro-batching broker.
+
+A class of ``--students`` submits its answers to question 1 at the same
+moment through /answer (with ``--full``, every student then plays the rest
+of the conversation, so later answers arrive more spread out).  The fake
+classifier takes ``--latency`` seconds per call plus
+``--item-latency`` per response in a batched call.  Reports /answer
+throughput and latency, and how many classifier calls were made.
+
+    python benchmarks/classifier_batching.py --students 64 --latency 0.5 [--full]
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import load_app, percentile, run_conversation
+
+
+def first_answer(app_module, i, barrier, record):
+    client = app_module.app.test_client()
+    data = client.post('/start', json={"name": "Bench", "email": "bench@example.org"}).get_json()
+    body = {
+        "conversation_id": data["conversation_id"],
+        "question_index": 0,
+        "attempt": 0,
+        "response": f"Student {i} restarted the server.",
+    }
+    barrier.wait()
+    started = time.perf_counter()
+    resp = client.post('/answer', json=body)
+    record('/answer', time.perf_counter() - started, None, None)
+    if resp.status_code != 200:
+        raise RuntimeError(f"/answer returned {resp.status_code}")
+
+
+def run_scenario(app_module, name, batching, students, full):
+    app_module.CLASSIFIER_BATCHING = batching
+    app_module.llm_classifier.calls = 0
+    latencies = []
+    lock = threading.Lock()
+
+    def record(route, seconds, _req, _resp):
+        if route == '/answer':
+            with lock:
+                latencies.append(seconds)
+
+    barrier = threading.Barrier(students)
+
+    def student(i):
+        if full:
+            barrier.wait()
+            run_conversation(app_module, answer_text=f"Student {i} restarted the server.", on_request=record)
+        else:
+            first_answer(app_module, i, barrier, record)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=students) as pool:
+        list(pool.map(student, range(students)))
+    wall = time.perf_counter() - started
+
+    print(f"{name:<18} answers/s={len(latencies) / wall:7.2f} "
+          f"p50={percentile(latencies, 50):6.3f}s p95={percentile(latencies, 95):6.3f}s "
+          f"classifier calls={app_module.llm_classifier.calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake LLM call")
+    parser.add_argument("--item-latency", type=float, default=0.02,
+                        help="extra seconds per response in a batched call")
+    parser.add_argument("--max-in-flight", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--batch-wait-ms", type=int, default=50)
+    parser.add_argument("--full", action="store_true", help="play whole conversations")
+    args = parser.parse_args()
+
+    app_module = load_app(
+        latency=args.latency,
+        CLASSIFICATION_CACHE="0",
+        CLASSIFIER_BATCHING="1",
+        CLASSIFIER_BATCH_SIZE=args.batch_size,
+        CLASSIFIER_BATCH_WAIT_MS=args.batch_wait_ms,
+        LLM_MAX_IN_FLIGHT=args.max_in_flight,
+    )
+    app_module.llm_classifier.item_latency = args.item_latency
+    print(f"{args.students} students, fake LLM latency {args.latency}s "
+          f"(+{args.item_latency}s per batched response), at most {args.max_in_flight} LLM calls in flight")
+    run_scenario(app_module, "before: unbatched", False, args.students, args.full)
+    run_scenario(app_module, "after: batched", True, args.students, args.full)
+    stats = app_module.classifier_batcher.stats()
+    print(f"batches={stats['batches']} mean size={stats['mean_batch']:.1f} largest={stats['largest_batch']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare two result files of benchmarks/run.py.
+
+    python benchmarks/compare.py benchmarks/results/1a2b3c4.json benchmarks/results/5d6e7f8.json
+
+Prints throughput, latency and errors per route, mean time per stage and
+database growth side by side with the relative change.  Changes for the
+worse by more than ``--threshold`` percent are marked; with ``--check`` the
+exit status is 1 if there are any.  Runs with different settings are
+compared anyway, after a warning.
+"""
+
+import argparse
+import json
+import sys
+
+# (name, value from a result, True if higher is better)
+SUMMARY = [
+    ("requests/s", lambda r: r["throughput"]["requests_per_s"], True),
+    ("answers/s", lambda r: r["throughput"]["answers_per_s"], True),
+    ("conversations/s", lambda r: r["throughput"]["conversations_per_s"], True),
+    ("completed", lambda r: r["outcomes"].get("completed", 0), True),
+    ("db bytes/conversation", lambda r: r["database"]["bytes_per_conversation"], False),
+]
+ROUTE_METRICS = [("p50", False), ("p95", False), ("p99", False), ("errors", False)]
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def change(old, new):
+    if old == new:
+        return 0.0
+    return (new - old) / old * 100 if old else float("inf")
+
+
+def rows(base, new):
+    """Yield (name, base value, new value, higher is better, unit)."""
+    for name, get, higher_is_better in SUMMARY:
+        yield name, get(base), get(new), higher_is_better, ""
+    for route in sorted(set(base["routes"]) | set(new["routes"])):
+        old_stats = base["routes"].get(route)
+        new_stats = new["routes"].get(route)
+        if old_stats is None or new_stats is None:
+            continue
+        for metric, higher_is_better in ROUTE_METRICS:
+            unit = "" if metric == "errors" else "ms"
+            scale = 1 if metric == "errors" else 1000
+            yield (f"{route} {metric}", old_stats[metric] * scale, new_stats[metric] * scale,
+                   higher_is_better, unit)
+    for stage in sorted(set(base["stages"]) & set(new["stages"])):
+        yield f"stage {stage}", base["stages"][stage] * 1000, new["stages"][stage] * 1000, False, "ms"
+    old_rows = base["database"]["rows_per_conversation"]
+    new_rows = new["database"]["rows_per_conversation"]
+    for table in sorted(set(old_rows) & set(new_rows)):
+        if old_rows[table] or new_rows[table]:
+            yield f"rows/conversation {table}", old_rows[table], new_rows[table], False, ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts")
+    parser.add_argument("--check", action="store_true", help="exit with 1 on a regression")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    if base["config"] != new["config"]:
+        differing = sorted(k for k in set(base["config"]) | set(new["config"])
+                           if base["config"].get(k) != new["config"].get(k))
+        print(f"warning: runs differ in {', '.join(differing)}")
+
+    def title(result):
+        return result["commit"] + ("-dirty" if result["dirty"] else "") + (f" {result['label']}" if result["label"] else "")
+
+    print(f"{'':<36} {title(base):>16} {title(new):>16} {'change':>9}")
+    regressions = 0
+    for name, old, current, higher_is_better, unit in rows(base, new):
+        pct = change(old, current)
+        worse = (pct < -args.threshold) if higher_is_better else (pct > args.threshold)
+        better = (pct > args.threshold) if higher_is_better else (pct < -args.threshold)
+        mark = "  worse" if worse else ("  better" if better else "")
+        regressions += worse
+        print(f"{name:<36} {old:>14.2f}{unit:<2} {current:>14.2f}{unit:<2} {pct:>+8.1f}%{mark}")
+    if args.check and regressions:
+        print(f"{regressions} regression(s) over {args.threshold:g}%")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark: duplicate /answer submissions (double-clicks and retries).
+
+Every answer of every conversation is posted ``--copies`` times at once, as a
+double-click would, and then once more after the first copies returned, as a
+browser retry would.  Reports LLM calls and stored attempts against what a
+single submission per answer needs, and whether all copies got the same reply.
+
+    python benchmarks/duplicate_answers.py --students 8 --copies 2 --latency 0.2
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import load_app
+
+
+def play(app_module, copies, pool):
+    client = app_module.app.test_client()
+    client.post('/set_language', json={"language": "en"})
+    data = client.post('/start', json={"name": "Bench", "email": "bench@example.org"}).get_json()
+    conversation_id = data["conversation_id"]
+    answers = mismatches = 0
+    while not data.get("end"):
+        body = {
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": f"Answer {data['question_index']}.{data['attempt']}",
+        }
+        barrier = threading.Barrier(copies)
+
+        def post(_):
+            barrier.wait()
+            return app_module.app.test_client().post('/answer', json=body).get_json()
+
+        replies = list(pool.map(post, range(copies)))
+        replies.append(client.post('/answer', json=body).get_json())
+        answers += 1
+        mismatches += sum(json.dumps(r, sort_keys=True) != json.dumps(replies[0], sort_keys=True)
+                          for r in replies)
+        data = replies[0]
+    return conversation_id, answers, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=8)
+    parser.add_argument("--copies", type=int, default=2, help="simultaneous copies of each answer")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake LLM call")
+    args = parser.parse_args()
+
+    app_module = load_app(latency=args.latency, CLASSIFICATION_CACHE="0")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.students) as students, \
+            ThreadPoolExecutor(max_workers=args.students * args.copies) as pool:
+        results = list(students.map(lambda _: play(app_module, args.copies, pool), range(args.students)))
+    wall = time.perf_counter() - started
+
+    answers = sum(n for _, n, _ in results)
+    mismatches = sum(m for _, _, m in results)
+    stored = 0
+    with app_module.app.app_context():
+        for conversation_id, _, _ in results:
+            student_data = app_module.get_student_data(conversation_id)
+            stored += sum(len(r["attempts"]) for r in student_data["responses"])
+    llm_calls = app_module.llm_classifier.calls + app_module.llm_followup.calls
+    followups = app_module.llm_followup.calls
+
+    print(f"{args.students} students, {answers} answers, each posted {args.copies}x at once + 1 retry "
+          f"({answers * (args.copies + 1)} requests) in {wall:.1f}s")
+    print(f"classifier calls={app_module.llm_classifier.calls} (one per answer: {answers})")
+    print(f"follow-up calls={followups}  total LLM calls={llm_calls}")
+    print(f"attempts stored={stored} (expected {answers})  differing replies={mismatches}")
+    print(f"dedup: {app_module.answer_dedup_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Benchmark: memory and speed of the bulk export as the database grows.
+
+Fills a throwaway database with ``--sizes`` conversations (three questions,
+three attempts each), then exports it twice: the way it had to be done
+before, by loading every Student with its responses, attempts and
+classifications through the ORM, and with the streaming export.  Reports
+peak Python heap (tracemalloc) and records per second.
+
+    python benchmarks/export_memory.py --sizes 250 1000 4000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from harness import load_app
+
+ANSWER = "We missed the deadline because the test server was down and nobody noticed. " * 3
+
+
+def fill(app_module, conversations):
+    now = app_module._now()
+    with app_module.app.app_context(), app_module.db.engine.begin() as conn:
+        for _ in range(conversations):
+            student_data = {
+                "conversation_id": str(uuid.uuid4()),
+                "name": "Bench",
+                "email": "bench@example.org",
+                "language": "en",
+                "responses": [],
+            }
+            app_module._write_conversation(conn, student_data, None, now)
+            for question_index, question in enumerate(app_module.questions):
+                criteria = question["criteria"]
+                student_data["responses"].append({
+                    "question_id": f"question{question_index + 1}",
+                    "question_text": question["question"]["en"],
+                    "attempts": [],
+                    "unmet_criteria": criteria,
+                })
+                for attempt in range(3):
+                    attempt_data = {
+                        "attempt_number": attempt + 1,
+                        "response_type": "main" if attempt == 0 else "followup",
+                        "response": ANSWER,
+                        "classification": {c: "False" for c in criteria},
+                        "unmet_criteria": criteria,
+                        "next_followup_question": "Could you say more?",
+                    }
+                    student_data["responses"][-1]["attempts"].append(attempt_data)
+                    app_module._write_conversation(conn, student_data, attempt_data, now)
+
+
+def orm_export(app_module):
+    records = []
+    for student in app_module.Student.query.all():
+        for response in student.responses:
+            for attempt in response.attempts:
+                records.append({
+                    "conversation_id": student.conversation_id,
+                    "name": student.name,
+                    "email": student.email,
+                    "language": student.language,
+                    "conversation_status": student.conversation_status,
+                    "start_time": student.start_time,
+                    "end_time": student.end_time,
+                    "question_number": response.question_number,
+                    "question_text": response.question_text,
+                    "final_unmet_criteria": response.final_unmet_criteria,
+                    "attempt_number": attempt.attempt_number,
+                    "response_type": attempt.response_type,
+                    "followup_question": attempt.question_text if attempt.attempt_number > 1 else None,
+                    "response_text": attempt.response_text,
+                    "unmet_criteria": attempt.unmet_criteria,
+                    "classification": {c.criterion: c.is_met for c in attempt.classifications},
+                    "graded_locally": [c.criterion for c in attempt.classifications if c.source == 'local'],
+                })
+    out = app_module.export_formats.export_stream(iter(records), app_module.EXPORT_FIELDS, "ndjson")
+    return sum(len(chunk) for chunk in out), len(records)
+
+
+def streaming_export(app_module):
+    records = 0
+
+    def counted():
+        nonlocal records
+        for record in app_module.export_records():
+            records += 1
+            yield record
+
+    out = app_module.export_formats.export_stream(counted(), app_module.EXPORT_FIELDS, "ndjson")
+    return sum(len(chunk) for chunk in out), records
+
+
+def measure(app_module, name, export, conversations):
+    # Timed without tracemalloc, which slows allocation-heavy code a lot
+    with app_module.app.app_context():
+        started = time.perf_counter()
+        size, records = export(app_module)
+        elapsed = time.perf_counter() - started
+        app_module.db.session.remove()
+    with app_module.app.app_context():
+        tracemalloc.start()
+        export(app_module)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        app_module.db.session.remove()
+    print(f"{conversations:>6} conversations  {name:<10} records={records:<7} "
+          f"output={size / 1e6:7.1f}MB peak heap={peak / 1e6:7.1f}MB records/s={records / elapsed:9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 1000, 4000])
+    args = parser.parse_args()
+
+    app_module = load_app(db_path=os.path.join(tempfile.mkdtemp(prefix="reflection-export-"), "bench.db"))
+    total = 0
+    for size in sorted(args.sizes):
+        fill(app_module, size - total)
+        total = size
+        measure(app_module, "ORM", orm_export, size)
+        measure(app_module, "streaming", streaming_export, size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Deterministic stand-in for ``ChatOpenAI`` used by the benchmarks.
+
+The fake answers the app's two prompts without any network access:
+
+* structured-output (classification) calls, which must use tool calling
+  (``method="function_calling"``), get a tool call with a boolean per schema
+  field, derived from a hash of (response, criterion) so reruns
+  are reproducible.  A batched call gets one item per tagged response, with
+  the verdicts a single call for that response would get;
+* anything else gets a short follow-up question.
+
+``latency`` is slept with ``time.sleep``, which a gevent worker turns into a
+yield to its other requests, like a real network wait; that is what makes
+the fake useful for load tests of the worker configurations.
+A batched call additionally sleeps ``item_latency`` per response, since a
+longer reply takes longer to generate.  ``jitter`` adds up to that many
+seconds more per call, a ``tail_rate`` share of calls takes ``tail_latency``
+more, and ``failure_rate`` is the share of calls that raise
+:class:`FakeLLMError` (an HTTP 500 from the OpenAI client) once their
+latency has passed; streams fail before the first token.  All of them draw
+from a generator seeded with ``seed``.
+
+Replies carry ``usage_metadata`` with token counts estimated at four
+characters per token, so token and cost metrics have something to count.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+import httpx
+import openai
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+
+def verdict(response_text, criterion, met_rate=0.5):
+    """Deterministic pseudo-random verdict for one criterion."""
+    digest = hashlib.sha256(f"{criterion}\x00{response_text}".encode()).digest()
+    return digest[0] / 255.0 < met_rate
+
+
+def usage(messages, reply):
+    input_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+    output_tokens = len(reply) // 4 + 1
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens}
+
+
+BATCH_ITEM = re.compile(r'<response index="(\d+)">\n(.*?)\n</response>', re.S)
+
+
+class FakeLLMError(openai.InternalServerError):
+    """A failure injected by FakeChatModel."""
+
+    def __init__(self, message="injected failure"):
+        request = httpx.Request("POST", "https://fake-llm.invalid/v1/chat/completions")
+        super().__init__(message, response=httpx.Response(500, request=request), body=None)
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    met_rate: float = 0.5
+    item_latency: float = 0.0
+    jitter: float = 0.0
+    tail_rate: float = 0.0
+    tail_latency: float = 0.0
+    failure_rate: float = 0.0
+    seed: int = 0
+    calls: int = 0
+    failures: int = 0
+    _rng: random.Random = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "fake-reflection"
+
+    def bind_tools(self, tools, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def with_structured_output(self, schema, *, method="function_calling", include_raw=False, **kwargs):
+        # Only tool calling is served; fail loudly rather than answer a
+        # response_format request with tool calls no real model would send.
+        if method != "function_calling":
+            raise ValueError(f"FakeChatModel only serves method='function_calling', not {method!r}")
+        return super().with_structured_output(schema, include_raw=include_raw, **kwargs)
+
+    def _reply(self, messages, tools=None):
+        self.calls += 1
+        human = messages[-1].content if messages else ""
+        if tools:
+            function = tools[0]["function"]
+            properties = function["parameters"]["properties"]
+            if properties.get("items", {}).get("type") == "array":
+                # Batched classification: one item per <response index="n"> block
+                fields = properties["items"]["items"]["properties"]
+                args = {"items": [
+                    {"index": int(index), **self._verdicts(text.strip(), fields)}
+                    for index, text in BATCH_ITEM.findall(human)
+                ]}
+            else:
+                args = self._verdicts(human, properties)
+            message = AIMessage(content="", tool_calls=[
+                {"name": function["name"], "args": args, "id": f"call_{self.calls}"}
+            ], usage_metadata=usage(messages, json.dumps(args)))
+        else:
+            content = "Could you describe in more detail what you would do differently next time?"
+            message = AIMessage(content=content, usage_metadata=usage(messages, content))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _verdicts(self, response_text, fields):
+        return {
+            name: verdict(response_text, spec.get("description", name), self.met_rate)
+            for name, spec in fields.items() if spec.get("type") == "boolean"
+        }
+
+    def _plan(self, messages):
+        """Return (seconds to sleep, whether to fail) for one call."""
+        items = len(BATCH_ITEM.findall(messages[-1].content)) if messages else 0
+        with self._lock:
+            if self._rng is None:
+                self._rng = random.Random(self.seed)
+            extra = self._rng.uniform(0, self.jitter) if self.jitter else 0.0
+            if self.tail_rate > 0 and self._rng.random() < self.tail_rate:
+                extra += self.tail_latency
+            fail = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+            self.failures += fail
+        return self.latency + self.item_latency * items + extra, fail
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, fail = self._plan(messages)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeLLMError()
+        return self._reply(messages, kwargs.get("tools"))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # Half the latency before the first token, the rest spread over the words.
+        # Like OpenAI's, the stream ends with an empty chunk carrying the usage.
+        delay, fail = self._plan(messages)
+        if delay:
+            time.sleep(delay / 2)
+        if fail:
+            raise FakeLLMError()
+        message = self._reply(messages).generations[0].message
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            if delay:
+                time.sleep(delay / 2 / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata))
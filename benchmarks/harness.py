@@ -0,0 +1,91 @@
+"""Shared setup for the benchmark scripts.
+
+``load_app`` imports ``app.py`` against a throwaway SQLite database with the
+LLM clients replaced by :class:`fake_llm.FakeChatModel`, so benchmarks never
+touch ``students.db`` or the OpenAI API.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import FakeChatModel  # noqa: E402
+
+
+def load_app(latency=0.0, met_rate=0.5, db_path=None, create_schema=True,
+             jitter=0.0, tail_rate=0.0, tail_latency=0.0, failure_rate=0.0, seed=0, **env):
+    """Import the app configured for benchmarking and return the module.
+
+    ``latency``, ``met_rate``, ``jitter``, ``tail_rate``, ``tail_latency``,
+    ``failure_rate`` and ``seed`` configure both fake LLMs; ``env`` is set in the environment first.
+    Configuration is read at import time, so this works once per process.
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="reflection-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("FLASK_SECRET_KEY", "benchmark")
+    os.environ.update({k: str(v) for k, v in env.items()})
+
+    import app as app_module
+
+    fake = {"latency": latency, "met_rate": met_rate, "jitter": jitter,
+            "tail_rate": tail_rate, "tail_latency": tail_latency, "failure_rate": failure_rate}
+    app_module.build_llm_chains(FakeChatModel(**fake, seed=seed), FakeChatModel(**fake, seed=seed + 1))
+    if create_schema:
+        with app_module.app.app_context():
+            app_module.create_tables()
+    return app_module
+
+
+def run_conversation(app_module, lang="en", answer_text="I tried restarting the server.", on_request=None,
+                     periodic_save=True):
+    """Drive one full conversation through the HTTP routes.
+
+    With ``periodic_save`` every answer is preceded by the temporary
+    ``/end_session`` the browser sends every 30 seconds.
+    ``on_request(route, seconds, request_bytes, response_bytes)`` is called
+    after every request.  Returns the conversation id.
+    """
+    client = app_module.app.test_client()
+
+    def post(route, payload):
+        started = time.perf_counter()
+        resp = client.post(route, json=payload)
+        elapsed = time.perf_counter() - started
+        if on_request is not None:
+            on_request(route, elapsed, len(json.dumps(payload)), len(resp.data))
+        if resp.status_code != 200:
+            raise RuntimeError(f"{route} returned {resp.status_code}")
+        return resp.get_json(silent=True)
+
+    post('/set_language', {"language": lang})
+    data = post('/start', {"name": "Bench", "email": "bench@example.org"})
+    conversation_id = data["conversation_id"]
+    n = 0
+    while not data.get("end"):
+        n += 1
+        if periodic_save:
+            post('/end_session', {"conversation_id": conversation_id, "is_temporary": True})
+        data = post('/answer', {
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": f"{answer_text} ({n})",
+        })
+    return conversation_id
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,92 @@
+"""Load test: concurrent students per Gunicorn worker, by worker class.
+
+One worker is modelled as a pool of request threads: 1 for the classic sync
+worker, ``--threads`` for a gthread worker.  For the gevent worker gevent's
+monkey patching is applied first, as gunicorn.conf.py does, and the same pool
+spawns one greenlet per request on a single OS thread.  Each worker class
+runs in its own process, with cold caches and a throwaway SQLite database;
+each student runs a whole conversation (with the browser's periodic save)
+against the real routes, and the LLM is a local fake that sleeps
+``--latency`` seconds per call.
+
+    python benchmarks/load_answer.py --students 128 --threads 32 --latency 0.5
+
+The sync worker serves one student at a time, so its scenario only runs
+``--sync-students`` of them.
+
+"Concurrent students" is the average number of /answer requests in progress
+(Little's law: throughput x mean latency).
+"""
+
+import sys
+
+if __name__ == '__main__' and "--worker=gevent" in sys.argv:
+    # Must happen before anything creates a lock or imports the app.
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse  # noqa: E402
+import subprocess  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+from harness import load_app, percentile, run_conversation  # noqa: E402
+from llm_runtime import LLMRunner  # noqa: E402
+
+
+def run_scenario(app_module, name, threads, students, max_in_flight):
+    app_module.llm_runner = LLMRunner(max_in_flight=max_in_flight)
+    latencies = []
+    lock = threading.Lock()
+
+    def record(route, seconds, _req, _resp):
+        if route == '/answer':
+            with lock:
+                latencies.append(seconds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as worker:
+        list(worker.map(lambda i: run_conversation(app_module, on_request=record), range(students)))
+    wall = time.perf_counter() - started
+
+    throughput = len(latencies) / wall
+    mean = sum(latencies) / len(latencies)
+    print(f"{name:<28} threads={threads:<3} answers/s={throughput:7.2f} "
+          f"p50={percentile(latencies, 50):6.3f}s p95={percentile(latencies, 95):6.3f}s "
+          f"concurrent students={throughput * mean:5.1f} "
+          f"peak LLM in flight={app_module.llm_runner.peak_in_flight}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=128)
+    parser.add_argument("--sync-students", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake LLM call")
+    parser.add_argument("--max-in-flight", type=int, default=128)
+    parser.add_argument("--worker", choices=("sync", "gthread", "gevent"),
+                        help="only run this worker class, in this process")
+    args = parser.parse_args()
+
+    if args.worker is None:
+        print(f"{args.students} students, fake LLM latency {args.latency}s", flush=True)
+        for worker in ("sync", "gthread", "gevent"):
+            subprocess.run([sys.executable, __file__, f"--worker={worker}", *sys.argv[1:]], check=True)
+        return
+
+    app_module = load_app(latency=args.latency)
+    if args.worker == "sync":
+        run_scenario(app_module, "before: sync worker", 1, min(args.students, args.sync_students), args.max_in_flight)
+    elif args.worker == "gthread":
+        run_scenario(app_module, "gthread worker", args.threads, args.students, args.max_in_flight)
+    else:
+        # One OS thread; the pool's "threads" are greenlets, one per request
+        run_scenario(app_module, "after: gevent worker", args.students, args.students, args.max_in_flight)
+    stats = app_module.conversation_cache_stats()
+    print(f"{'':<28} conversation cache hit rate {stats['hit_rate']:.1%} "
+          f"({stats['hits']} hits, {stats['stale']} stale, {stats['misses']} misses)", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark: request/response bytes for one full three-question conversation.
+
+No criterion is ever met, so every question takes all three attempts (nine
+answers).  Bodies are measured as the JSON the browser sends and the bytes the
+server returns for /start and each /answer.
+
+    python benchmarks/payload_sizes.py
+"""
+
+import json
+
+from harness import load_app
+
+ANSWER = ("When we rolled out the dashboard, half of the teachers could not log in because "
+          "the single sign-on was misconfigured, so I collected the error reports and "
+          "escalated them to IT while giving out temporary accounts. ") * 2
+
+
+def main():
+    app_module = load_app(met_rate=0.0, CLASSIFICATION_CACHE="0")
+    client = app_module.app.test_client()
+    client.post('/set_language', json={"language": "en"})
+
+    resp = client.post('/start', json={"name": "Bench", "email": "bench@example.org"})
+    data = resp.get_json()
+    print(f"{'request':<10} {'sent':>8} {'received':>9}")
+    print(f"{'/start':<10} {len(json.dumps({'name': 'Bench', 'email': 'bench@example.org'})):>8} {len(resp.data):>9}")
+
+    conversation_id = data["conversation_id"]
+    sent_total = received_total = 0
+    n = 0
+    while not data.get("end"):
+        n += 1
+        payload = json.dumps({
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": ANSWER,
+        })
+        resp = client.post('/answer', data=payload, content_type='application/json')
+        data = resp.get_json()
+        sent_total += len(payload)
+        received_total += len(resp.data)
+        print(f"{f'/answer {n}':<10} {len(payload):>8} {len(resp.data):>9}")
+    print(f"{'total':<10} {sent_total:>8} {received_total:>9}  (answers only)")
+
+
+if __name__ == '__main__':
+    main()
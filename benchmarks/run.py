@@ -0,0 +1,300 @@
+"""Benchmark suite: whole conversations against the real routes, saved as JSON.
+
+Every simulated student goes through the flow of the browser (/set_language,
+/start, /answer until the conversation ends, each preceded by the periodic
+save, /download-chat, /end_session) on one of ``--concurrency`` threads, against the real app and a throwaway
+SQLite database.  The LLM is the local fake with ``--latency``, ``--jitter``,
+a slow tail (``--tail-rate`` calls take ``--tail-latency`` longer) and
+``--failure-rate``; a failed answer is sent again up to ``--retries``
+times, as the browser does, and then the student gives up.
+
+Reports throughput, p50/p95/p99 latency and errors per route, mean time per
+stage (from the app's metrics) and how much the database grew, and writes it
+all to ``--output`` (by default ``benchmarks/results/<commit>.json``) so that
+runs on two commits can be put side by side with ``compare.py``:
+
+    python benchmarks/run.py --students 64 --concurrency 32 --latency 0.5
+    python benchmarks/run.py --stream --env CLASSIFIER_BATCHING=1 --label batching
+    python benchmarks/compare.py benchmarks/results/1a2b3c4.json benchmarks/results/5d6e7f8.json
+
+One process models one Gunicorn worker; ``--env`` sets any app setting.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from harness import ROOT, load_app, percentile
+
+SCHEMA_VERSION = 1
+ANSWER = "The release slipped because the test server was down and nobody noticed until the demo."
+
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+
+class Recorder:
+    """Latencies and outcomes per route, shared by the student threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.outcomes = Counter()
+
+    def request(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def outcome(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+
+def sse_done(body):
+    """The payload of the ``done`` event of an /answer/stream body, or None."""
+    for block in body.decode("utf-8").split("\n\n"):
+        lines = block.split("\n")
+        if lines[0] == "event: done" and len(lines) > 1 and lines[1].startswith("data: "):
+            return json.loads(lines[1][len("data: "):])
+    return None
+
+
+def run_student(app_module, index, args, recorder):
+    client = app_module.app.test_client()
+    lang = args.languages[index % len(args.languages)]
+    answer_route = '/answer/stream' if args.stream else '/answer'
+
+    def post(route, payload):
+        started = time.perf_counter()
+        resp = client.post(route, json=payload)
+        body = resp.get_data()
+        resp.close()
+        elapsed = time.perf_counter() - started
+        if resp.status_code != 200:
+            data = None
+        elif route == '/answer/stream':
+            data = sse_done(body)
+        elif resp.is_json:
+            data = resp.get_json()
+        else:
+            data = {}
+        recorder.request(route, elapsed, data is not None)
+        return data
+
+    post('/set_language', {"language": lang})
+    data = post('/start', {"name": f"Student {index}", "email": f"student{index}@example.org"})
+    if data is None:
+        recorder.outcome("failed_to_start")
+        return
+    conversation_id = data["conversation_id"]
+    n = 0
+    while not data.get("end"):
+        n += 1
+        payload = {
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": f"{ANSWER} (student {index}, answer {n})",
+        }
+        # The browser's periodic save (a temporary end) fires between turns
+        post('/end_session', {"conversation_id": conversation_id, "is_temporary": True})
+        for _ in range(args.retries + 1):
+            reply = post(answer_route, payload)
+            if reply is not None:
+                break
+        if reply is None:
+            post('/end_session', {"conversation_id": conversation_id, "is_temporary": True})
+            recorder.outcome("abandoned")
+            return
+        data = reply
+    post('/download-chat', {"conversation_id": conversation_id})
+    post('/end_session', {"conversation_id": conversation_id, "is_temporary": True})
+    recorder.outcome("completed")
+
+
+def database_size(app_module):
+    """Bytes on disk (after a WAL checkpoint) and rows per table."""
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            rows = {
+                table.name: conn.execute(app_module.db.select(app_module.db.func.count()).select_from(table)).scalar()
+                for table in app_module.db.metadata.sorted_tables
+            }
+        path = engine.url.database
+    size = sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+    return size, rows
+
+
+def route_stats(latencies, errors):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies),
+    }
+
+
+def run(args):
+    env = dict(item.split("=", 1) for item in args.env)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="reflection-suite-"), "bench.db")
+    app_module = load_app(
+        latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate, tail_latency=args.tail_latency,
+        failure_rate=args.failure_rate, seed=args.seed,
+        met_rate=args.met_rate, db_path=db_path, **env,
+    )
+    # Injected failures make Flask log a traceback per failed request
+    app_module.app.logger.setLevel(logging.CRITICAL)
+    bytes_before, rows_before = database_size(app_module)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(lambda i: run_student(app_module, i, args, recorder), range(args.students)))
+    wall = time.perf_counter() - started
+    if app_module.PERSISTENCE_MODE == 'write_behind':
+        app_module.get_journal().flush()
+    bytes_after, rows_after = database_size(app_module)
+
+    conversations = args.students
+    fakes = (app_module.llm_classifier, app_module.llm_followup)
+    requests = sum(len(v) for v in recorder.latencies.values())
+    answers = sum(len(recorder.latencies.get(r, ())) for r in ('/answer', '/answer/stream'))
+    commit, dirty = git_revision()
+    return {
+        "schema": SCHEMA_VERSION,
+        "label": args.label,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": {
+            "students": args.students,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "tail_rate": args.tail_rate,
+            "tail_latency": args.tail_latency,
+            "failure_rate": args.failure_rate,
+            "met_rate": args.met_rate,
+            "retries": args.retries,
+            "stream": args.stream,
+            "languages": args.languages,
+            "seed": args.seed,
+            "env": env,
+        },
+        "wall_seconds": wall,
+        "throughput": {
+            "requests_per_s": requests / wall,
+            "answers_per_s": answers / wall,
+            "conversations_per_s": recorder.outcomes["completed"] / wall,
+        },
+        "outcomes": dict(recorder.outcomes),
+        "routes": {
+            route: route_stats(latencies, recorder.errors[route])
+            for route, latencies in sorted(recorder.latencies.items())
+        },
+        "stages": {
+            stage: total / count
+            for (stage,), (count, total) in sorted(app_module.stage_seconds.totals().items())
+        },
+        "llm": {
+            "calls": sum(f.calls + f.failures for f in fakes),
+            "failures": sum(f.failures for f in fakes),
+            "policies": {purpose: policy.stats() for purpose, policy in app_module.LLM_POLICIES.items()},
+            "fallbacks": sum(app_module.llm_fallbacks.totals().values()),
+        },
+        "conversation_cache": app_module.conversation_cache_stats(),
+        "database": {
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_per_conversation": (bytes_after - bytes_before) / conversations,
+            "rows": rows_after,
+            "rows_per_conversation": {
+                table: (n - rows_before.get(table, 0)) / conversations for table, n in rows_after.items()
+            },
+        },
+    }
+
+
+def report(result):
+    config = result["config"]
+    print(f"{config['students']} students on {config['concurrency']} threads, fake LLM "
+          f"{config['latency']}s (+{config['jitter']}s jitter, {config['failure_rate']:.0%} failures)")
+    print(f"wall {result['wall_seconds']:.2f}s  "
+          + "  ".join(f"{name}={value:.2f}" for name, value in result["throughput"].items())
+          + "  " + "  ".join(f"{name}={n}" for name, n in sorted(result["outcomes"].items())))
+    print(f"{'route':<16} {'requests':>8} {'errors':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for route, stats in result["routes"].items():
+        print(f"{route:<16} {stats['requests']:>8} {stats['errors']:>6} "
+              + " ".join(f"{stats[k] * 1000:>7.1f}ms" for k in ("p50", "p95", "p99", "max")))
+    print("mean per stage: " + "  ".join(f"{stage}={seconds * 1000:.1f}ms"
+                                         for stage, seconds in result["stages"].items()))
+    llm = result["llm"]
+    policies = llm["policies"].values()
+    print(f"LLM: calls={llm['calls']} failures={llm['failures']} fallbacks={llm['fallbacks']} "
+          + " ".join(f"{stat}={sum(p[stat] for p in policies)}"
+                     for stat in ("retries", "timeouts", "hedges", "hedge_wins", "rejected")))
+    cache = result["conversation_cache"]
+    print(f"conversation cache: hit rate {cache['hit_rate']:.1%} "
+          f"({cache['hits']} hits, {cache['stale']} stale, {cache['misses']} misses)")
+    database = result["database"]
+    print(f"database: {database['bytes_before'] / 1e6:.2f}MB -> {database['bytes_after'] / 1e6:.2f}MB "
+          f"({database['bytes_per_conversation'] / 1e3:.1f}kB per conversation); rows per conversation: "
+          + ", ".join(f"{table}={n:g}" for table, n in database["rows_per_conversation"].items() if n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16, help="request threads")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per call")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="share of LLM calls that are slow")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="extra seconds of a slow call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of LLM calls that fail")
+    parser.add_argument("--met-rate", type=float, default=0.5, help="share of criteria the fake finds met")
+    parser.add_argument("--retries", type=int, default=1, help="times a failed answer is sent again")
+    parser.add_argument("--stream", action="store_true", help="answer through /answer/stream")
+    parser.add_argument("--languages", nargs="+", default=["en", "de", "es", "et"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="app setting")
+    parser.add_argument("--label", default="", help="appended to the default output name")
+    parser.add_argument("--output", help="result file (default benchmarks/results/<commit>[-label].json)")
+    args = parser.parse_args()
+
+    result = run(args)
+    report(result)
+    output = args.output
+    if output is None:
+        name = result["commit"] + ("-dirty" if result["dirty"] else "") + (f"-{args.label}" if args.label else "")
+        output = os.path.join(ROOT, "benchmarks", "results", f"{name}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark: SQL statements per /answer against conversation length.
+
+Drives one conversation in which no criterion is ever met, so every question
+takes all three attempts (nine answers in total), and counts the statements
+the engine executes for each /answer.
+
+    python benchmarks/save_queries.py
+"""
+
+import time
+
+from sqlalchemy import event
+
+from harness import load_app
+
+
+def main():
+    app_module = load_app(met_rate=0.0, CLASSIFICATION_CACHE="0")
+    client = app_module.app.test_client()
+    statements = []
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    client.post('/set_language', json={"language": "en"})
+    data = client.post('/start', json={"name": "Bench", "email": "bench@example.org"}).get_json()
+    conversation_id = data["conversation_id"]
+
+    print(f"{'answer':>6} {'statements':>10} {'ms':>7}")
+    n = 0
+    while not data.get("end"):
+        n += 1
+        statements.clear()
+        started = time.perf_counter()
+        data = client.post('/answer', json={
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": f"answer {n}",
+        }).get_json()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{n:>6} {len(statements):>10} {elapsed:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark: how long a fresh process takes to import app.py and serve.
+
+Runs ``python -X importtime -c "import app"`` in ``--repeat`` new processes
+and reports the fastest import of ``app`` with the modules it imports that
+cost the most.  A further process times the steps a Gunicorn worker goes
+through: importing app.py, ``create_app()``, its first request (``/``) and
+building the LLM clients and chains, which happens on the first LLM call.
+
+The exit status is 1 when the import takes longer than ``--budget`` seconds
+or pulls in any of the ``--deferred`` modules, which should only be loaded
+on the first LLM call:
+
+    python benchmarks/startup_time.py --budget 1.5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from harness import ROOT
+
+DEFERRED = ["langchain_openai", "openai"]
+
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+app_module.build_llm_chains()
+built = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "create_app": created - imported,
+    "first_request": served - created,
+    "llm_clients": built - served,
+}))
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="reflection-startup-"), "bench.db")
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("FLASK_SECRET_KEY", "benchmark")
+    return env
+
+
+def import_times(env):
+    """{module: (self µs, cumulative µs, depth)} from one ``-X importtime`` run."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(own), int(cumulative), depth)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Imports of app.py to list.")
+    parser.add_argument("--budget", type=float, default=1.5, help="Seconds allowed for importing app.py.")
+    parser.add_argument("--deferred", nargs="*", default=DEFERRED,
+                        help="Modules that importing app.py must not load.")
+    args = parser.parse_args()
+
+    env = environment()
+    runs = [import_times(env) for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times["app"][1])
+    total = best["app"][1] / 1e6
+    direct = sorted(((cumulative, name) for name, (_, cumulative, depth) in best.items() if depth == 1),
+                    reverse=True)
+    print(f"import app: {total * 1000:.0f}ms (best of {args.repeat}), "
+          f"{best['app'][0] / 1000:.0f}ms in app.py itself, {len(best)} modules")
+    for cumulative, name in direct[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    startup = json.loads(subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout)
+    print("worker startup: " + "  ".join(f"{step}={seconds * 1000:.0f}ms" for step, seconds in startup.items()))
+
+    failed = False
+    loaded = [name for name in args.deferred if name in best]
+    if loaded:
+        print(f"FAIL: importing app.py loads {', '.join(loaded)}")
+        failed = True
+    if total > args.budget:
+        print(f"FAIL: import took {total:.2f}s, over the budget of {args.budget:.2f}s")
+        failed = True
+    if not failed:
+        print(f"ok: within the budget of {args.budget:.2f}s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
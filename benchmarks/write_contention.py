@@ -0,0 +1,120 @@
+"""Benchmark: multi-process write contention on the SQLite database.
+
+Starts ``--processes`` worker processes against one database file.  Each one
+plays ``--conversations`` full conversations through ``save_student_data``
+(one new conversation plus nine attempts, i.e. the writes of a class
+session) with no LLM in between, which is the worst case for lock
+contention.  Runs once per storage profile and reports commits per second,
+commit latency and how many transactions failed.
+
+    python benchmarks/write_contention.py --processes 8 --conversations 20
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+
+from harness import percentile
+
+
+def create_schema(db_path, profile):
+    from harness import load_app
+    load_app(db_path=db_path, STORAGE_PROFILE=profile)
+
+
+def worker(db_path, profile, conversations, ready, go, results):
+    from harness import load_app
+
+    app_module = load_app(db_path=db_path, create_schema=False, STORAGE_PROFILE=profile)
+    ready.put(os.getpid())
+    go.wait()
+    latencies = []
+    failures = 0
+    criteria = app_module.questions[0]["criteria"]
+
+    def timed_save(student_data, new_attempt=None):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            with app_module.app.app_context():
+                app_module.save_student_data(student_data, new_attempt=new_attempt)
+        except app_module.OperationalError:
+            failures += 1
+            return
+        latencies.append(time.perf_counter() - started)
+
+    for _ in range(conversations):
+        student_data = {
+            "conversation_id": str(uuid.uuid4()),
+            "name": "Bench",
+            "email": "bench@example.org",
+            "language": "en",
+            "responses": [],
+        }
+        timed_save(student_data)
+        for question_index, question in enumerate(app_module.questions):
+            student_data["responses"].append({
+                "question_id": f"question{question_index + 1}",
+                "question_text": question["question"]["en"],
+                "attempts": [],
+                "unmet_criteria": criteria,
+            })
+            for attempt in range(3):
+                attempt_data = {
+                    "attempt_number": attempt + 1,
+                    "response_type": "main" if attempt == 0 else "followup",
+                    "response": "x" * 400,
+                    "classification": {c: "False" for c in criteria},
+                    "unmet_criteria": criteria,
+                    "next_followup_question": "Could you say more?",
+                }
+                student_data["responses"][-1]["attempts"].append(attempt_data)
+                timed_save(student_data, new_attempt=attempt_data)
+    results.put((latencies, failures))
+
+
+def run_profile(profile, processes, conversations):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="reflection-contention-"), "bench.db")
+    ctx = multiprocessing.get_context("spawn")
+    setup = ctx.Process(target=create_schema, args=(db_path, profile))
+    setup.start()
+    setup.join()
+
+    ready, go, results = ctx.Queue(), ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(db_path, profile, conversations, ready, go, results))
+             for _ in range(processes)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get()  # wait until every process has imported the app
+    started = time.perf_counter()
+    go.set()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - started
+
+    latencies = [lat for lats, _ in collected for lat in lats]
+    failures = sum(f for _, f in collected)
+    print(f"{profile:<11} commits/s={len(latencies) / wall:8.1f} "
+          f"p50={percentile(latencies, 50) * 1000:7.2f}ms p95={percentile(latencies, 95) * 1000:7.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:7.2f}ms failed={failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.conversations} conversations (10 commits each)")
+    for profile in args.profiles:
+        run_profile(profile, args.processes, args.conversations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Streaming encoders for bulk exports.
+
+Every function takes and returns an iterator, so an export is produced one
+chunk at a time and memory use does not depend on how many records it has.
+Records are flat dicts; values that are not strings or numbers (datetimes,
+lists, dicts) are written as ISO timestamps or JSON.
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+
+import zstandard
+
+FORMATS = ("ndjson", "csv")
+COMPRESSIONS = ("none", "zstd")
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+CHUNK_BYTES = 64 * 1024
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def _csv_value(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def ndjson_chunks(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, default=_default) + "\n"
+
+
+def csv_chunks(records, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for record in records:
+        writer.writerow({name: _csv_value(record.get(name)) for name in fields})
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode(chunks):
+    """UTF-8 encode text chunks, gathered into pieces of about CHUNK_BYTES."""
+    pending = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b"".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def zstd_compress(chunks, level=3):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(records, fields, fmt="ndjson", compression="none"):
+    """Bytes of ``records`` in format ``fmt``, optionally zstd-compressed."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt!r}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown export compression: {compression!r}")
+    text = ndjson_chunks(records) if fmt == "ndjson" else csv_chunks(records, fields)
+    data = encode(text)
+    return zstd_compress(data) if compression == "zstd" else data
+
+
+def filename(fmt, compression, stem="conversations"):
+    return f"{stem}.{fmt}" + (".zst" if compression == "zstd" else "")
@@ -0,0 +1,184 @@
+"""Local graders that settle clear-cut classifications without the LLM.
+
+A grader's ``scores(response_text, criteria, lang)`` returns, for the
+criteria it has an opinion on, the estimated probability that the response
+meets each one.  :class:`TieredGrader` asks its tiers in order and keeps a
+verdict only when the probability is at most ``unmet_below`` or at least
+``met_above``; every other criterion is left for the LLM.
+
+Two tiers are provided:
+
+* :class:`HeuristicGrader` – empty, one-word and gibberish answers meet no
+  criterion.
+* :class:`NaiveBayesGrader` – a bag-of-words model per criterion, trained
+  from verdicts the LLM gave earlier (``flask train-grader``).
+
+:func:`evaluate` measures how often a grader's local verdicts agree with
+stored ones.
+"""
+
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return [w.casefold() for w in WORD.findall(unicodedata.normalize("NFC", text))]
+
+
+class HeuristicGrader:
+    """Answers too short or too repetitive to reflect on meet no criterion."""
+
+    def __init__(self, min_words=3, min_distinct_ratio=0.3, min_letter_ratio=0.5):
+        self.min_words = min_words
+        self.min_distinct_ratio = min_distinct_ratio
+        self.min_letter_ratio = min_letter_ratio
+
+    def scores(self, response_text, criteria, lang):
+        text = "".join(response_text.split())
+        words = tokenize(response_text)
+        if (len(words) < self.min_words
+                or len(set(words)) / len(words) < self.min_distinct_ratio
+                or sum(ch.isalpha() for ch in text) / len(text) < self.min_letter_ratio):
+            return {criterion: 0.0 for criterion in criteria}
+        return {}
+
+
+class NaiveBayesGrader:
+    """Multinomial naive Bayes over word counts, one model per criterion.
+
+    Criteria with fewer than ``min_examples`` stored verdicts of either kind
+    get no opinion.
+    """
+
+    def __init__(self, models=None, vocabulary_size=1, alpha=1.0, min_examples=20):
+        # criterion -> {"docs": [unmet, met], "totals": [unmet, met],
+        #               "counts": [{word: n}, {word: n}]}
+        self.models = models or {}
+        self.vocabulary_size = vocabulary_size
+        self.alpha = alpha
+        self.min_examples = min_examples
+
+    @classmethod
+    def train(cls, examples, min_count=2, **kwargs):
+        """Fit from ``(response_text, criterion, is_met)`` triples."""
+        counts = {}
+        docs = {}
+        vocabulary = Counter()
+        for response_text, criterion, is_met in examples:
+            words = Counter(tokenize(response_text))
+            vocabulary.update(words)
+            label = int(bool(is_met))
+            counts.setdefault(criterion, (Counter(), Counter()))[label].update(words)
+            docs.setdefault(criterion, [0, 0])[label] += 1
+
+        kept = {word for word, n in vocabulary.items() if n >= min_count}
+        models = {}
+        for criterion, per_label in counts.items():
+            filtered = [{w: n for w, n in c.items() if w in kept} for c in per_label]
+            models[criterion] = {
+                "docs": docs[criterion],
+                "totals": [sum(c.values()) for c in filtered],
+                "counts": filtered,
+            }
+        return cls(models, vocabulary_size=max(len(kept), 1), **kwargs)
+
+    def scores(self, response_text, criteria, lang):
+        words = tokenize(response_text)
+        result = {}
+        for criterion in criteria:
+            model = self.models.get(criterion)
+            if model is None or min(model["docs"]) < self.min_examples:
+                continue
+            log_odds = math.log(model["docs"][1]) - math.log(model["docs"][0])
+            denominators = [t + self.alpha * self.vocabulary_size for t in model["totals"]]
+            for word in words:
+                met = model["counts"][1].get(word)
+                unmet = model["counts"][0].get(word)
+                if met is None and unmet is None:
+                    continue  # Unknown word: no evidence either way
+                log_odds += (math.log(((met or 0) + self.alpha) / denominators[1])
+                             - math.log(((unmet or 0) + self.alpha) / denominators[0]))
+            result[criterion] = 1 / (1 + math.exp(-max(min(log_odds, 50), -50)))
+        return result
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "vocabulary_size": self.vocabulary_size,
+                "alpha": self.alpha,
+                "models": self.models,
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["models"], vocabulary_size=data["vocabulary_size"], alpha=data["alpha"], **kwargs)
+
+
+class TieredGrader:
+    """Ask local graders in turn and keep only their confident verdicts."""
+
+    def __init__(self, tiers, unmet_below=0.05, met_above=0.95):
+        self.tiers = list(tiers)
+        self.unmet_below = unmet_below
+        self.met_above = met_above
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def decide(self, response_text, criteria, lang):
+        """Return {criterion: "True"/"False"} for the criteria settled locally."""
+        decided = {}
+        for tier in self.tiers:
+            pending = [c for c in criteria if c not in decided]
+            if not pending:
+                break
+            for criterion, probability in tier.scores(response_text, pending, lang).items():
+                if probability <= self.unmet_below:
+                    decided[criterion] = "False"
+                elif probability >= self.met_above:
+                    decided[criterion] = "True"
+        with self._lock:
+            self._counts["criteria_local"] += len(decided)
+            self._counts["criteria_escalated"] += len(criteria) - len(decided)
+            self._counts["responses_local" if len(decided) == len(criteria) else "responses_escalated"] += 1
+        return decided
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+def evaluate(grader, rows):
+    """Compare ``grader``'s local verdicts with stored ones.
+
+    ``rows`` yields ``(response_text, lang, {criterion: is_met})`` per
+    attempt.  Returns counts plus ``coverage`` (share of verdicts settled
+    locally), ``agreement`` (share of those matching the stored verdict)
+    and ``responses_local`` (attempts that would not have reached the LLM).
+    """
+    totals = Counter()
+    for response_text, lang, stored in rows:
+        decided = grader.decide(response_text, list(stored), lang)
+        totals["responses"] += 1
+        totals["verdicts"] += len(stored)
+        totals["responses_local"] += len(decided) == len(stored)
+        for criterion, verdict in decided.items():
+            local_met = verdict == "True"
+            totals["local"] += 1
+            if local_met == stored[criterion]:
+                totals["agree"] += 1
+            elif local_met:
+                totals["false_met"] += 1
+            else:
+                totals["false_unmet"] += 1
+    result = dict(totals)
+    result["coverage"] = totals["local"] / totals["verdicts"] if totals["verdicts"] else 0.0
+    result["agreement"] = totals["agree"] / totals["local"] if totals["local"] else 0.0
+    return result
@@ -0,0 +1,60 @@
+# Gunicorn settings for ReflectionApp.
+#
+# LLM calls dominate every /answer, so workers are gevent workers: each request
+# runs in a greenlet, and one waiting on the model yields to the others, so a
+# single worker thread keeps many students in flight. LLM_MAX_IN_FLIGHT caps
+# the calls per worker. GUNICORN_WORKER_CLASS=gthread runs threaded workers
+# instead. Bind address is left to the command line (e.g. --bind
+# unix:/run/reflectionapp.sock).
+#
+# Each worker builds its own app, and with it its database pool, after the
+# fork; its LLM clients are built on its first LLM call. app.py itself is
+# imported once, by on_starting in the master, so workers start without
+# importing it again. With PERSISTENCE_MODE=write_behind a booting worker
+# replays the journals of dead workers before it accepts requests.
+#
+# Write-behind also needs every request of a conversation to reach the same
+# worker: a worker answers from turns it has journaled but not yet written,
+# which the others cannot see. Gunicorn cannot route by conversation, so in
+# that mode it runs a single (gevent) worker and refuses to start with more.
+
+import multiprocessing
+import os
+
+write_behind = os.getenv("PERSISTENCE_MODE", "sync") == "write_behind"
+workers = int(os.getenv("GUNICORN_WORKERS", 1 if write_behind else multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "256"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+wsgi_app = "app:create_app()"
+
+if worker_class == "gevent":
+    # Patch before on_starting imports app.py: the locks, semaphores and
+    # thread pools it creates must yield to other greenlets, not block the
+    # worker's only thread.
+    from gevent import monkey
+    monkey.patch_all()
+    # Gunicorn's control socket runs asyncio on a thread of its own, which the
+    # patched master cannot provide.
+    control_socket_disable = True
+
+
+def on_starting(server):
+    if write_behind and server.cfg.workers > 1:
+        raise RuntimeError(
+            f"PERSISTENCE_MODE=write_behind needs a single worker (got {server.cfg.workers}): "
+            "another worker would read conversations from the database before this one's "
+            "journal has been written to it")
+    # Create missing tables and indexes once, in the master, before any
+    # worker starts writing. The master's connections must not leak into
+    # the forked workers, so the pool is emptied afterwards.
+    from app import create_app, create_tables, db
+    with create_app().app_context():
+        create_tables()
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    from app import start_journal
+    start_journal(worker.wsgi)
@@ -0,0 +1,199 @@
+"""Append-only write-ahead journal with a background group-commit writer.
+
+``WriteJournal.append`` makes a record durable (written and fsynced to a
+journal file) and returns; a background thread later hands the records to
+``apply_batch`` in groups, which writes them to the database in one
+transaction.  Concurrent appends share fsyncs, so a burst of turns costs one
+disk flush rather than one each.
+
+``apply_batch(records, journal_name, last_seq)`` must record ``last_seq`` for
+``journal_name`` in the same transaction as the records (a checkpoint).  On
+startup, :func:`replay_orphans` re-applies every record of journals left
+behind by dead processes that is newer than its checkpoint, which makes
+replay exactly-once even if a process died between a commit and the
+truncation of its journal.
+
+Each process owns one journal file and holds an exclusive ``flock`` on it
+for its lifetime; a journal whose lock can be taken belongs to a process
+that is gone.
+"""
+
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATTERN = "journal-*.log"
+
+
+class WriteJournal:
+    """Durable queue of records drained to the database by a writer thread."""
+
+    def __init__(self, directory, apply_batch, flush_interval=0.05, max_batch=256):
+        os.makedirs(directory, exist_ok=True)
+        self.name = f"journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.log"
+        self.path = os.path.join(directory, self.name)
+        self._apply_batch = apply_batch
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+
+        self._file = open(self.path, "ab")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._applied = threading.Condition()
+        self._wake = threading.Event()
+        self._pending = []
+        self._seq = 0
+        self._synced_seq = 0
+        self._applied_seq = 0
+        self._closed = False
+        # Called with each applied batch of (seq, record), after applied_seq
+        # has moved past it.
+        self.on_applied = None
+
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    # -- producer side -----------------------------------------------------
+
+    def append(self, record, sync=True):
+        """Durably journal ``record`` and queue it for the writer; return its seq.
+
+        With ``sync=False`` the fsync is skipped: the record only becomes
+        durable with the next synced append, for records that can be lost.
+        """
+        with self._write_lock:
+            self._seq += 1
+            seq = self._seq
+            self._file.write(json.dumps({"seq": seq, **record}).encode("utf-8") + b"\n")
+            self._file.flush()
+            self._pending.append((seq, record))
+        if sync:
+            self._sync(seq)
+        self._wake.set()
+        return seq
+
+    def _sync(self, seq):
+        # Whoever gets the lock first fsyncs everything written so far; the
+        # others find their record already covered and return immediately.
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._write_lock:
+                target = self._seq
+            os.fsync(self._file.fileno())
+            self._synced_seq = target
+
+    def flush(self, timeout=None):
+        """Block until every record appended so far has been applied."""
+        with self._write_lock:
+            target = self._seq
+        self._wake.set()
+        with self._applied:
+            return self._applied.wait_for(lambda: self._applied_seq >= target, timeout)
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+        self._file.close()
+
+    @property
+    def applied_seq(self):
+        """Highest seq known to be in the database."""
+        return self._applied_seq
+
+    def backlog(self):
+        """Number of journaled records not yet applied."""
+        with self._write_lock:
+            return len(self._pending)
+
+    # -- writer thread -----------------------------------------------------
+
+    def _run(self):
+        failures = 0
+        while not self._closed:
+            self._wake.wait(self._flush_interval if not failures else min(5.0, 0.1 * 2 ** failures))
+            self._wake.clear()
+            while True:
+                with self._write_lock:
+                    batch = self._pending[:self._max_batch]
+                if not batch:
+                    break
+                last_seq = batch[-1][0]
+                try:
+                    self._apply_batch([record for _, record in batch], self.name, last_seq)
+                except Exception:
+                    failures += 1
+                    logger.exception("Journal batch up to seq %s failed; will retry", last_seq)
+                    break
+                failures = 0
+                with self._write_lock:
+                    del self._pending[:len(batch)]
+                    if not self._pending:
+                        # Everything is in the database: start the file afresh.
+                        # Sequence numbers keep counting, so the checkpoint
+                        # stays valid.
+                        self._file.truncate(0)
+                with self._applied:
+                    self._applied_seq = last_seq
+                if self.on_applied is not None:
+                    self.on_applied(batch)
+                with self._applied:
+                    self._applied.notify_all()
+
+
+def read_journal(path):
+    """Yield (seq, record) from a journal file, ignoring a torn last line."""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            yield record.pop("seq"), record
+
+
+def replay_orphans(directory, apply_batch, checkpoint, forget=None, max_batch=256):
+    """Apply the unapplied records of journals whose process has died.
+
+    ``checkpoint(journal_name)`` returns the last applied seq (0 if none);
+    ``forget(journal_name)``, if given, is called once a journal has been
+    replayed and removed.  Returns the number of records replayed.
+    """
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(directory, JOURNAL_PATTERN))):
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # Owned by a live process
+            done = checkpoint(name)
+            batch = []
+            for seq, record in read_journal(path):
+                if seq <= done:
+                    continue
+                batch.append((seq, record))
+                if len(batch) >= max_batch:
+                    apply_batch([r for _, r in batch], name, batch[-1][0])
+                    replayed += len(batch)
+                    batch = []
+            if batch:
+                apply_batch([r for _, r in batch], name, batch[-1][0])
+                replayed += len(batch)
+            os.remove(path)
+        if forget is not None:
+            forget(name)
+        logger.info("Replayed journal %s", name)
+    return replayed
@@ -0,0 +1,370 @@
+"""Execution of LLM calls for the request handlers.
+
+Every ``/answer`` makes one or two LLM round trips that spend almost all of
+their time waiting on the network.  ``LLMRunner`` runs them on the calling
+request's thread or greenlet and caps the number of LLM calls in flight per
+process.  Under the gevent worker (see gunicorn.conf.py) the threading
+primitives used here are patched, so a call waiting on the network, for its
+slot or for its deadline yields to the worker's other requests.
+
+A :class:`CallPolicy` passed with a call adds a deadline, bounded retries
+with jittered exponential backoff and, optionally, a hedged duplicate call
+once the call has taken longer than a percentile of its recent latencies.
+Its :class:`CircuitBreaker` rejects calls outright while the provider keeps
+failing.  When a call cannot be completed the runner raises
+:class:`LLMUnavailable`, so the caller can fall back.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class LLMUnavailable(Exception):
+    """The call failed after its retries, or the circuit breaker is open."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Rejected without calling the provider, since the circuit is open."""
+
+
+class LLMTimeout(Exception):
+    """One attempt missed the policy's deadline."""
+
+
+class SlotTimeout(LLMTimeout):
+    """One attempt got no in-flight slot within the policy's ``queue_timeout``."""
+
+
+class CircuitBreaker:
+    """Stop calling a provider after ``failure_threshold`` failures in a row.
+
+    Once open, calls are rejected for ``reset_timeout`` seconds; then a
+    single probe is let through (half open), which closes the circuit if it
+    succeeds and opens it again if it fails.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def release(self):
+        """The provider answered with an error that says nothing about its health."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened += 1
+                self._opened_at = self.clock()
+                self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class CallPolicy:
+    """Deadline, retries and hedging for one kind of LLM call.
+
+    ``timeout`` bounds each attempt once it holds an in-flight slot, and
+    ``queue_timeout`` the wait for that slot (None waits indefinitely).
+    Failures that are instances of ``retry_on`` or for which
+    ``retryable(exc)`` is true (and both kinds of timeout) are retried up to
+    ``retries`` times, sleeping a random time of up to ``backoff * 2**n``
+    seconds before retry ``n``; other exceptions propagate unchanged.
+    With ``hedge_percentile``, an attempt still running after that
+    percentile of the last ``window`` successful latencies gets a duplicate
+    call, if a slot is free, and the first answer wins.
+    """
+
+    STATS = ("attempts", "timeouts", "queue_timeouts", "retries", "hedges", "hedge_wins", "failures", "rejected")
+
+    def __init__(self, name, timeout=None, retries=0, backoff=0.5, retry_on=(), retryable=None,
+                 hedge_percentile=None, hedge_min_samples=20, window=200, breaker=None, queue_timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = tuple(retry_on) + (LLMTimeout,)
+        self.retryable = retryable
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self._latencies = deque(maxlen=window)
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def should_retry(self, exc):
+        return isinstance(exc, self.retry_on) or (self.retryable is not None and self.retryable(exc))
+
+    def hedge_delay(self):
+        """Seconds after which an attempt is hedged, or None."""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return ordered[index]
+
+    def backoff_delay(self, retry):
+        return random.uniform(0, self.backoff * 2 ** retry)
+
+    def count(self, event, n=1):
+        with self._lock:
+            self._counts[event] += n
+
+    def observe(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            return {name: self._counts[name] for name in self.STATS}
+
+
+class LLMRunner:
+    """Run LangChain runnables with a per-process cap on in-flight calls."""
+
+    def __init__(self, max_in_flight=32):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._sync_slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = None
+        self._executor_pid = None
+
+    # -- public API --------------------------------------------------------
+
+    def invoke(self, runnable, inputs, policy=None):
+        """Run ``runnable`` with ``inputs`` and return its output.
+
+        With a ``policy``, raises :class:`LLMUnavailable` when the call
+        cannot be completed.
+        """
+        if policy is None:
+            return self._call(runnable, inputs)
+        for attempt in range(policy.retries + 1):
+            self._admit(policy)
+            started = time.monotonic()
+            try:
+                result = self._attempt(runnable, inputs, policy)
+            except Exception as exc:
+                if not policy.should_retry(exc):
+                    self._released(policy)
+                    raise
+                time.sleep(self._failed(policy, exc, attempt))
+            except BaseException:
+                self._released(policy)
+                raise
+            else:
+                self._succeeded(policy, time.monotonic() - started)
+                return result
+
+    def stream(self, runnable, inputs, policy=None):
+        """Yield the chunks of ``runnable.stream(inputs)`` as they arrive.
+
+        The call holds one in-flight slot until the stream is exhausted or the
+        generator is closed.  A ``policy`` applies until the first chunk: a
+        stream that fails before it is retried, one that fails later raises.
+        The deadline is left to the client's own timeout.
+        """
+        if policy is None:
+            yield from self._stream_call(runnable, inputs)
+            return
+        for attempt in range(policy.retries + 1):
+            self._admit(policy)
+            started = time.monotonic()
+            chunks = self._stream_call(runnable, inputs, policy.queue_timeout)
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self._succeeded(policy, time.monotonic() - started)
+                return
+            except Exception as exc:
+                if not policy.should_retry(exc):
+                    self._released(policy)
+                    raise
+                time.sleep(self._failed(policy, exc, attempt))
+                continue
+            except BaseException:
+                self._released(policy)
+                raise
+            self._succeeded(policy, time.monotonic() - started)
+            yield first
+            yield from chunks
+            return
+
+    # -- internals ---------------------------------------------------------
+
+    def _call(self, runnable, inputs, queue_timeout=None):
+        self._take_slot(queue_timeout)
+        return self._call_in_slot(runnable, inputs)
+
+    def _call_in_slot(self, runnable, inputs):
+        try:
+            return runnable.invoke(inputs)
+        finally:
+            self._free_slot()
+
+    def _stream_call(self, runnable, inputs, queue_timeout=None):
+        self._take_slot(queue_timeout)
+        try:
+            yield from runnable.stream(inputs)
+        finally:
+            self._free_slot()
+
+    def _attempt(self, runnable, inputs, policy):
+        """One attempt of a sync call, with the policy's deadline and hedge.
+
+        The slot is taken here, within the policy's ``queue_timeout``, before
+        the call is handed to the executor: the deadline and the hedge delay
+        start once the call holds it, so waiting for one is not counted as a
+        slow provider.  Calls that miss the deadline keep their thread and
+        in-flight slot until they end; the client's own timeout bounds how
+        long that is.
+        """
+        hedge_after = policy.hedge_delay()
+        if policy.timeout is None and hedge_after is None:
+            return self._call(runnable, inputs, policy.queue_timeout)
+        executor = self._get_executor()
+        self._take_slot(policy.queue_timeout)
+        try:
+            primary = executor.submit(self._call_in_slot, runnable, inputs)
+        except BaseException:
+            self._free_slot()
+            raise
+        pending = {primary}
+        deadline = None if policy.timeout is None else time.monotonic() + policy.timeout
+        if hedge_after is not None and (policy.timeout is None or hedge_after < policy.timeout):
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done and self._take_slot(0, required=False):
+                policy.count("hedges")
+                pending.add(executor.submit(self._call_in_slot, runnable, inputs))
+        error = None
+        while pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        policy.count("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        if not pending:
+            raise error
+        raise LLMTimeout(f"no answer within {policy.timeout}s")
+
+    def _admit(self, policy):
+        if policy.breaker is not None and not policy.breaker.allow():
+            policy.count("rejected")
+            raise CircuitOpen(f"{policy.name}: circuit open")
+        policy.count("attempts")
+
+    def _failed(self, policy, exc, attempt):
+        """Record a failed attempt; return the backoff before the next one.
+
+        Raises LLMUnavailable after the last attempt.
+        """
+        if isinstance(exc, SlotTimeout):
+            # The provider was never called, so its health is unknown
+            policy.count("queue_timeouts")
+            self._released(policy)
+        else:
+            if isinstance(exc, LLMTimeout):
+                policy.count("timeouts")
+            if policy.breaker is not None:
+                policy.breaker.failure()
+        if attempt == policy.retries:
+            policy.count("failures")
+            raise LLMUnavailable(f"{policy.name} failed after {attempt + 1} attempts: {exc!r}") from exc
+        policy.count("retries")
+        return policy.backoff_delay(attempt)
+
+    def _succeeded(self, policy, seconds):
+        policy.observe(seconds)
+        if policy.breaker is not None:
+            policy.breaker.success()
+
+    def _released(self, policy):
+        if policy.breaker is not None:
+            policy.breaker.release()
+
+    def _get_executor(self):
+        # Threads for calls with a deadline or hedge, re-created after a fork
+        pid = os.getpid()
+        if self._executor is not None and self._executor_pid == pid:
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._executor_pid != pid:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * self.max_in_flight, thread_name_prefix="llm-call")
+                self._executor_pid = pid
+        return self._executor
+
+    def _take_slot(self, timeout=None, required=True):
+        """Wait up to ``timeout`` seconds (None: indefinitely) for a slot.
+
+        Raises :class:`SlotTimeout` when none came free, or returns False if
+        the slot is not ``required``.
+        """
+        if not self._sync_slots.acquire(timeout=timeout):
+            if required:
+                raise SlotTimeout(f"no in-flight slot within {timeout}s")
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return True
+
+    def _free_slot(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._sync_slots.release()
@@ -1,6 +1,6 @@
 // static/app.js
 
-let studentData = null;
+let conversationId = null;
 let questionIndex = 0;
 let attempt = 0;
 let firstQuestion = '';
@@ -219,12 +219,12 @@ function startChat() {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            studentData = data.student_data;
-            questionIndex = studentData.responses.length;
+            conversationId = data.student_data.conversation_id;
+            questionIndex = data.student_data.responses.length;
             attempt = 0;
             document.getElementById('start-form').style.display = 'none';
             document.getElementById('chat-container').style.display = 'block';
-            displayPreviousConversation(studentData);
+            displayPreviousConversation(data.student_data);
             showNextQuestion();
         } else {
             // Start a new session
@@ -237,7 +237,7 @@ function startChat() {
             })
             .then(response => response.json())
             .then(data => {
-                studentData = data.student_data;
+                conversationId = data.conversation_id;
                 questionIndex = data.question_index;
                 attempt = data.attempt;
                 firstQuestion = data.question;
@@ -289,47 +289,53 @@ function sendResponse(event) {
     document.getElementById('response-input').value = '';
 }
 
-// Function to handle fetching response from OpenAI
+// Function to handle fetching response from OpenAI.
+// Uses the server-sent events variant of /answer so that follow-up questions
+// appear token by token instead of after the whole round trip.
 function fetchResponseFromOpenAI(response) {
     // Clear any previous retry attempt
     clearTimeout(retryTimeout);
 
-    fetch('/answer', {
+    let streamingMessage = null;
+
+    fetch('/answer/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-            student_data: studentData,
+            conversation_id: conversationId,
             question_index: questionIndex,
             attempt: attempt,
             response: response,
         }),
     })
-    .then(response => response.json())
-    .then(data => {
-        clearTimeout(retryTimeout); // Clear timeout if a response is received
-        setTimeout(() => {
-            removeTypingIndicator();
-            if (data.end) {
-                isConversationEnded = true;
-                addMessage(data.message, 'question', false, true);
-                document.getElementById('response-form').style.display = 'none';
-                document.getElementById('download-btn').style.display = 'block';
-            } else {
-                // Reset retry attempts since we received a valid response
-                retryAttempt = 0;
-
-                // Process the next question
-                studentData = data.student_data;
-                questionIndex = data.question_index;
-                attempt = data.attempt;
-                addMessage(data.question, 'question', attempt === 0);
+    .then(res => {
+        if (!res.ok || !res.body) {
+            throw new Error(`Unexpected response status ${res.status}`);
+        }
+        return readEventStream(res.body, (event, data) => {
+            clearTimeout(retryTimeout); // The server is responding
+            if (event === 'token') {
+                if (!streamingMessage) {
+                    removeTypingIndicator();
+                    document.getElementById('send-btn').disabled = true;
+                    streamingMessage = addMessage('', 'question', false);
+                }
+                streamingMessage.textContent += data.text;
+                const chatBox = document.getElementById('chat-box');
+                chatBox.scrollTop = chatBox.scrollHeight;
+            } else if (event === 'done') {
+                handleAnswerResult(data, streamingMessage);
             }
-        }, 1500);
+        });
     })
     .catch(error => {
         console.error('Error with OpenAI request:', error);
+        if (streamingMessage) {
+            streamingMessage.remove();
+            chatHistory.pop();
+        }
         // Trigger retry after the set interval
         retryAfterTimeout(response);
     });
@@ -340,6 +346,74 @@ function fetchResponseFromOpenAI(response) {
     }, RETRY_INTERVAL);
 }
 
+// Read a text/event-stream body and call onEvent(event, data) for each event.
+function readEventStream(body, onEvent) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function dispatch(block) {
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event: ')) {
+                event = line.slice(7);
+            } else if (line.startsWith('data: ')) {
+                data += line.slice(6);
+            }
+        });
+        if (data) {
+            onEvent(event, JSON.parse(data));
+        }
+    }
+
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+            if (!done) {
+                return pump();
+            }
+        });
+    }
+
+    return pump();
+}
+
+function handleAnswerResult(data, streamingMessage) {
+    // Reset retry attempts since we received a valid response
+    retryAttempt = 0;
+
+    if (streamingMessage) {
+        // The follow-up question has already been rendered token by token
+        questionIndex = data.question_index;
+        attempt = data.attempt;
+        streamingMessage.textContent = data.question;
+        chatHistory[chatHistory.length - 1].message = data.question;
+        removeTypingIndicator();
+        return;
+    }
+
+    setTimeout(() => {
+        removeTypingIndicator();
+        if (data.end) {
+            isConversationEnded = true;
+            addMessage(data.message, 'question', false, true);
+            document.getElementById('response-form').style.display = 'none';
+            document.getElementById('download-btn').style.display = 'block';
+        } else {
+            // Process the next question
+            questionIndex = data.question_index;
+            attempt = data.attempt;
+            addMessage(data.question, 'question', attempt === 0);
+        }
+    }, 1500);
+}
+
 function retryAfterTimeout(response) {
     if (retryAttempt < RETRY_LIMIT) {
         retryAttempt++;
@@ -420,6 +494,8 @@ function addMessage(message, type, isMainQuestion = false, isFinalMessage = fals
         isFinalMessage: isFinalMessage,
         questionIndex: questionIndex
     });
+
+    return messageElement;
 }
 
 function showTypingIndicator() {
@@ -455,7 +531,7 @@ function downloadChat() {
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify(studentData),
+            body: JSON.stringify({ conversation_id: conversationId }),
         })
         .then(response => response.blob())
         .then(blob => {
@@ -472,14 +548,14 @@ function downloadChat() {
 }
 
 function endSession(isTemporary = false) {
-    if (studentData) {
+    if (conversationId) {
         fetch('/end_session', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                conversation_id: studentData.conversation_id,
+                conversation_id: conversationId,
                 is_temporary: isTemporary
             }),
         });
@@ -487,7 +563,7 @@ function endSession(isTemporary = false) {
 }
 
 function periodicSave() {
-    if (studentData && !isConversationEnded) {
+    if (conversationId && !isConversationEnded) {
         endSession(true);
     }
 }
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py on a throwaway database with fake LLMs; imported once per session.
+
+    Classifier batching is on, so both classification paths can be tested.
+    """
+    from harness import load_app
+    return load_app(db_path=str(tmp_path_factory.mktemp("db") / "test.db"), CLASSIFIER_BATCHING="1")
@@ -0,0 +1,30 @@
+from harness import run_conversation
+
+
+def summary_and_rebuilt(app_module):
+    with app_module.app.app_context():
+        incremental = app_module.analytics_summary()
+        app_module.rebuild_analytics()
+        return incremental, app_module.analytics_summary()
+
+
+def test_counters_match_a_rebuild_after_an_interrupted_conversation_is_finished(app_module):
+    client = app_module.app.test_client()
+    client.post('/set_language', json={"language": "en"})
+    data = client.post('/start', json={"name": "Test", "email": "test@example.org"}).get_json()
+    conversation_id = data["conversation_id"]
+    client.post('/end_session', json={"conversation_id": conversation_id, "is_temporary": False})
+    n = 0
+    while not data.get("end"):
+        n += 1
+        data = client.post('/answer', json={
+            "conversation_id": conversation_id,
+            "question_index": data["question_index"],
+            "attempt": data["attempt"],
+            "response": f"I would check the logs first ({n}).",
+        }).get_json()
+    run_conversation(app_module)
+
+    incremental, rebuilt = summary_and_rebuilt(app_module)
+    assert incremental == rebuilt
+    assert incremental["en"]["conversations"]["completed"] == 2
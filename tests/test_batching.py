@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fake_llm import BATCH_ITEM, FakeChatModel
+
+from batching import MicroBatcher
+
+
+def submit_all(batcher, keys_and_items):
+    with ThreadPoolExecutor(max_workers=len(keys_and_items)) as pool:
+        futures = [pool.submit(batcher.submit, key, item) for key, item in keys_and_items]
+    return futures
+
+
+def test_concurrent_items_share_one_call_per_key():
+    calls = []
+
+    def process(key, items):
+        calls.append((key, sorted(items)))
+        return [f"{key}:{item}" for item in items]
+
+    batcher = MicroBatcher(process, max_batch=3, max_wait=5)
+    futures = submit_all(batcher, [("a", 1), ("a", 2), ("a", 3), ("b", 4), ("b", 5), ("b", 6)])
+
+    assert [future.result() for future in futures] == ["a:1", "a:2", "a:3", "b:4", "b:5", "b:6"]
+    assert sorted(calls) == [("a", [1, 2, 3]), ("b", [4, 5, 6])]
+    assert batcher.stats() == {"batches": 2, "items": 6, "largest_batch": 3, "mean_batch": 3.0}
+
+
+def test_a_lone_item_is_sent_when_the_window_closes():
+    batcher = MicroBatcher(lambda key, items: [item * 2 for item in items], max_batch=16, max_wait=0.01)
+    assert batcher.submit("a", 21) == 42
+    assert batcher.stats()["largest_batch"] == 1
+
+
+@pytest.mark.parametrize("process, error", [
+    (lambda key, items: 1 / 0, ZeroDivisionError),
+    (lambda key, items: items[:-1], RuntimeError),
+])
+def test_a_failed_batch_fails_every_item(process, error):
+    batcher = MicroBatcher(process, max_batch=2, max_wait=5)
+    futures = submit_all(batcher, [("a", 1), ("a", 2)])
+    for future in futures:
+        with pytest.raises(error):
+            future.result()
+
+
+class OmittingModel(FakeChatModel):
+    """Leaves the responses containing ``omit`` out of batched replies."""
+
+    omit: str = "(omit)"
+
+    def _reply(self, messages, tools=None):
+        result = super()._reply(messages, tools)
+        omitted = {int(index) for index, text in BATCH_ITEM.findall(messages[-1].content) if self.omit in text}
+        for call in result.generations[0].message.tool_calls:
+            if "items" in call["args"]:
+                call["args"]["items"] = [item for item in call["args"]["items"] if item["index"] not in omitted]
+        return result
+
+
+@pytest.fixture
+def omitting_classifier(app_module):
+    model = OmittingModel()
+    classifier, followup = app_module._llm_models
+    app_module.build_llm_chains(model, followup)
+    yield model
+    app_module.build_llm_chains(classifier, followup)
+
+
+def test_responses_left_out_of_a_batch_reply_are_classified_one_by_one(app_module, omitting_classifier, monkeypatch):
+    single = []
+    classify_one = app_module._classify_one
+
+    def spy(text, criteria, lang):
+        single.append(text)
+        return classify_one(text, criteria, lang)
+
+    monkeypatch.setattr(app_module, "_classify_one", spy)
+    criteria = app_module.questions[0]["criteria"]
+    texts = ["first answer", "second answer (omit)", "first answer", "third answer"]
+
+    results = app_module._classify_batch((tuple(criteria), "en"), texts)
+
+    assert single == ["second answer (omit)"]
+    assert omitting_classifier.calls == 2
+    assert all(parsed_ok for _, parsed_ok in results)
+    assert results[0] == results[2]
+    assert [sorted(verdicts) for verdicts, _ in results] == [sorted(criteria)] * 4
+
+
+def test_classifier_chains_ask_chatopenai_for_tool_calls(app_module, monkeypatch):
+    # The fake only serves tool calls, so the real client must be asked for them too
+    langchain_openai = pytest.importorskip("langchain_openai")
+    monkeypatch.setattr(app_module, "llm_classifier", langchain_openai.ChatOpenAI(api_key="test", model="gpt-5.2"))
+    criteria = app_module.questions[0]["criteria"]
+    classifier_chain = app_module.ClassifierChain(1, criteria, criteria, batched=True)
+
+    for chain in (classifier_chain.chain, classifier_chain.batch_chain):
+        model_step = chain.bound.steps[1].steps__["raw"]
+        assert "tools" in model_step.kwargs
+        assert "response_format" not in model_step.kwargs
+
+
+def test_the_fake_refuses_response_format():
+    with pytest.raises(ValueError):
+        FakeChatModel().with_structured_output({"type": "object"}, method="json_schema")
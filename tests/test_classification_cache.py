@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+
+def test_pruning_by_age_keeps_recent_entries(app_module):
+    Entry = app_module.ClassificationCacheEntry
+    now = datetime.now(pytz.utc)
+    with app_module.app.app_context():
+        app_module.invalidate_classification_cache()
+        with app_module.db.engine.begin() as conn:
+            conn.execute(app_module.db.insert(Entry), [
+                {"key": f"k{age}", "model": "fake", "prompt_version": "v1", "result": {"c": "True"},
+                 "created_at": now - timedelta(days=age)}
+                for age in (0, 1, 29, 31, 40, 90, 365)
+            ])
+        app_module.classification_cache.set("k0", {"c": "True"})
+
+        assert app_module.invalidate_classification_cache(older_than_days=30, batch_size=2) == 4
+        with app_module.db.engine.connect() as conn:
+            keys = set(conn.execute(app_module.db.select(Entry.key)).scalars())
+        assert keys == {"k0", "k1", "k29"}
+        assert app_module.classification_cache.get("k0") is not None
+
+        assert app_module.invalidate_classification_cache() == 3
+        assert app_module.classification_cache.get("k0") is None
@@ -0,0 +1,33 @@
+from harness import run_conversation
+
+
+def test_periodic_saves_keep_the_conversation_cached(app_module):
+    answers = []
+
+    def record(route, *_):
+        if route == '/answer':
+            answers.append(route)
+
+    before = app_module.conversation_cache_stats()
+    conversation_id = run_conversation(app_module, periodic_save=True, on_request=record)
+    after = app_module.conversation_cache_stats()
+
+    assert after["stale"] == before["stale"]
+    assert after["misses"] == before["misses"]
+    assert after["hits"] - before["hits"] == len(answers) > 0
+
+    with app_module.app.app_context():
+        app_module.get_student_data(conversation_id)
+    assert app_module.conversation_cache_stats()["misses"] == after["misses"] + 1, "completed, so not cached"
+
+
+def test_a_real_end_invalidates_the_cached_copy(app_module):
+    client = app_module.app.test_client()
+    data = client.post('/start', json={"name": "Test", "email": "test@example.org"}).get_json()
+    conversation_id = data["conversation_id"]
+    assert app_module.conversation_cache.get(conversation_id) is not None
+
+    client.post('/end_session', json={"conversation_id": conversation_id, "is_temporary": True})
+    assert app_module.conversation_cache.get(conversation_id) is not None
+    client.post('/end_session', json={"conversation_id": conversation_id, "is_temporary": False})
+    assert app_module.conversation_cache.get(conversation_id) is None
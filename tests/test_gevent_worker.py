@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("gevent")
+
+# Run in a child process: monkey patching must come before the app is imported.
+SCRIPT = """
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path[:0] = [{root!r}, {root!r} + "/benchmarks"]
+from harness import load_app, run_conversation
+
+app_module = load_app(latency=0.2, db_path={db!r})
+started = time.perf_counter()
+with ThreadPoolExecutor(max_workers=8) as pool:
+    list(pool.map(lambda i: run_conversation(app_module), range(8)))
+print(time.perf_counter() - started, app_module.llm_runner.peak_in_flight, len(os.listdir('/proc/self/task')))
+"""
+
+
+def test_conversations_overlap_on_one_thread(tmp_path):
+    script = SCRIPT.format(root=ROOT, db=str(tmp_path / "gevent.db"))
+    out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True, timeout=120)
+    wall, peak_in_flight, threads = out.stdout.split()
+
+    # Eight conversations of about eight answers each, one or two 0.2 s LLM
+    # calls per answer: well over 10 s one after the other.
+    assert float(wall) < 8
+    assert int(peak_in_flight) >= 4
+    assert int(threads) == 1, "OS threads"
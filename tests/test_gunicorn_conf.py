@@ -0,0 +1,27 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import ROOT
+
+
+def load_config(monkeypatch, **env):
+    # gthread, so loading the config does not monkey-patch the test process
+    monkeypatch.setenv("GUNICORN_WORKER_CLASS", "gthread")
+    monkeypatch.delenv("GUNICORN_WORKERS", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+
+
+def test_write_behind_defaults_to_one_worker(monkeypatch):
+    assert load_config(monkeypatch, PERSISTENCE_MODE="write_behind")["workers"] == 1
+    assert load_config(monkeypatch, PERSISTENCE_MODE="sync")["workers"] == os.cpu_count()
+
+
+def test_write_behind_refuses_several_workers(monkeypatch):
+    config = load_config(monkeypatch, PERSISTENCE_MODE="write_behind")
+    with pytest.raises(RuntimeError, match="single worker"):
+        config["on_starting"](SimpleNamespace(cfg=SimpleNamespace(workers=4)))
@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from journal import read_journal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Journals one conversation with a writer that commits its first batch and
+# then hangs before truncating the journal, and dies with the rest unapplied.
+CRASH = """
+import json, os, threading
+from harness import load_app, run_conversation
+app_module = load_app(db_path=os.environ["TEST_DB"])
+apply = app_module._apply_journal_batch_in
+applied = threading.Event()
+
+def apply_then_hang(app, records, journal_name, last_seq):
+    apply(app, records, journal_name, last_seq)
+    applied.set()
+    threading.Event().wait()
+
+app_module._apply_journal_batch_in = apply_then_hang
+run_conversation(app_module)
+applied.wait(10)
+os._exit(0)
+"""
+
+# Boots a worker as Gunicorn would and reports what it replayed.
+BOOT = """
+import json, os, runpy, types
+from harness import load_app
+app_module = load_app(db_path=os.environ["TEST_DB"])
+apply = app_module._apply_journal_batch
+replayed = []
+
+def record_replay(records, journal_name, last_seq):
+    replayed.extend(range(last_seq - len(records) + 1, last_seq + 1))
+    apply(records, journal_name, last_seq)
+
+app_module._apply_journal_batch = record_replay
+config = runpy.run_path(os.path.join(os.environ["ROOT"], "gunicorn.conf.py"))
+config["post_worker_init"](types.SimpleNamespace(wsgi=app_module.app))
+with app_module.app.app_context():
+    incremental = app_module.analytics_summary()
+    app_module.rebuild_analytics()
+    rebuilt = app_module.analytics_summary()
+print(json.dumps({"replayed": replayed, "analytics_match": incremental == rebuilt,
+                  "unflushed": len(app_module._unflushed_conversations)}))
+"""
+
+
+def run(script, env):
+    return subprocess.run([sys.executable, "-c", script], cwd=os.path.join(ROOT, "benchmarks"),
+                          env=env, capture_output=True, text=True, check=True, timeout=60).stdout
+
+
+def test_orphaned_journal_is_replayed_exactly_once_when_a_worker_boots(tmp_path):
+    journal_dir = tmp_path / "journal"
+    env = dict(os.environ, ROOT=ROOT, TEST_DB=str(tmp_path / "test.db"), PERSISTENCE_MODE="write_behind",
+               JOURNAL_DIR=str(journal_dir), STORAGE_PROFILE="production")
+    run(CRASH, env)
+
+    [orphan] = os.listdir(journal_dir)
+    seqs = [seq for seq, _ in read_journal(journal_dir / orphan)]
+    with sqlite3.connect(tmp_path / "test.db") as conn:
+        [(checkpoint,)] = conn.execute("SELECT seq FROM journal_checkpoint WHERE journal = ?", (orphan,))
+    assert 0 < checkpoint < seqs[-1]
+
+    result = json.loads(run(BOOT, env))
+    assert result["replayed"] == [seq for seq in seqs if seq > checkpoint]
+    assert result["analytics_match"]
+    assert result["unflushed"] == 0
+    assert os.listdir(journal_dir) != [orphan]
+    with sqlite3.connect(tmp_path / "test.db") as conn:
+        assert conn.execute("SELECT conversation_status FROM student").fetchall() == [("completed",)]
+        assert conn.execute("SELECT count(*) FROM journal_checkpoint WHERE journal = ?", (orphan,)).fetchone() == (0,)
+
+    # A second boot finds nothing left to replay
+    assert json.loads(run(BOOT, env))["replayed"] == []
+
+
+def test_journal_batches_commit_with_full_sync(app_module):
+    def synchronous(conn):
+        return conn.exec_driver_sql("PRAGMA synchronous").scalar()
+
+    with app_module.app.app_context():
+        assert app_module._commit_durably(synchronous) == 2  # FULL
+        # The pooled connection is back on the profile's NORMAL
+        assert app_module._commit_now(synchronous) == 1
@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fake_llm import FakeChatModel, FakeLLMError
+
+from llm_runtime import CallPolicy, CircuitBreaker, CircuitOpen, LLMRunner, LLMUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_probes_after_cooldown():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.failure()
+    assert breaker.allow() and breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 9.9
+    assert not breaker.allow()
+    clock.now = 10
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow(), "only one probe while half open"
+
+    breaker.failure()
+    assert breaker.state == "open" and breaker.stats()["opened"] == 2
+    clock.now = 20
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+    assert breaker.stats()["rejected"] == 3
+
+
+def test_breaker_release_frees_the_probe():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, clock=clock)
+    breaker.failure()
+    clock.now = 1
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.allow()
+
+
+def test_retries_then_falls_back_and_opens_circuit():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    policy = CallPolicy("classify", retries=2, backoff=0, retry_on=(FakeLLMError,), breaker=breaker)
+    runner = LLMRunner(max_in_flight=2)
+    model = FakeChatModel(failure_rate=1.0)
+
+    with pytest.raises(LLMUnavailable):
+        runner.invoke(model, "hello", policy)
+    assert model.failures == 3
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        runner.invoke(model, "hello", policy)
+    assert model.failures == 3
+    stats = policy.stats()
+    assert (stats["attempts"], stats["retries"], stats["failures"], stats["rejected"]) == (3, 2, 1, 1)
+
+
+def test_non_retryable_error_propagates():
+    policy = CallPolicy("followup", retries=2, backoff=0, breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(FakeLLMError):
+        LLMRunner().invoke(FakeChatModel(failure_rate=1.0), "hello", policy)
+    assert policy.breaker.state == "closed"
+    assert policy.stats()["attempts"] == 1
+
+
+def test_missed_deadline_is_retried():
+    policy = CallPolicy("followup", timeout=0.05, retries=1, backoff=0)
+    with pytest.raises(LLMUnavailable):
+        LLMRunner().invoke(FakeChatModel(latency=0.2), "hello", policy)
+    assert policy.stats()["timeouts"] == 2
+
+
+def test_waiting_for_a_slot_does_not_count_against_the_deadline():
+    # 16 calls through 2 slots: the last ones queue for far longer than the
+    # deadline, but each call itself answers well within it.
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    policy = CallPolicy("classify", timeout=0.5, retries=0, breaker=breaker)
+    runner = LLMRunner(max_in_flight=2)
+    model = FakeChatModel(latency=0.1)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda _: runner.invoke(model, "hello", policy), range(16)))
+
+    assert len(results) == 16
+    assert runner.peak_in_flight == 2
+    assert policy.stats()["timeouts"] == 0
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0, "opened": 0, "rejected": 0}
+
+
+def test_waiting_too_long_for_a_slot_is_retried_then_falls_back():
+    # One slot, held by a slow call: the second call gives up on the slot,
+    # without calling the provider or counting against the breaker.
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    policy = CallPolicy("classify", timeout=5, queue_timeout=0.05, retries=1, backoff=0, breaker=breaker)
+    runner = LLMRunner(max_in_flight=1)
+    slow, queued = FakeChatModel(latency=0.5), FakeChatModel()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        holder = pool.submit(runner.invoke, slow, "hello")
+        while runner.in_flight == 0:
+            pass
+        with pytest.raises(LLMUnavailable):
+            runner.invoke(queued, "hello", policy)
+        holder.result()
+
+    assert queued.calls == 0
+    stats = policy.stats()
+    assert (stats["queue_timeouts"], stats["timeouts"], stats["retries"], stats["failures"]) == (2, 0, 1, 1)
+    assert breaker.state == "closed"
+    assert runner.in_flight == 0
+    assert runner.invoke(queued, "hello", policy) is not None